@@ -0,0 +1,229 @@
+"""
+
+Benchmarks for the hot paths of Release Robbe
+
+Run all of them with `python benchmark.py`, or some with
+`python benchmark.py dedupe`. `python benchmark.py import` exits with an
+error, if importing release_robbe got heavier again.
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import difflib
+import random
+import string
+import subprocess
+import sys
+import time
+from datetime import datetime
+import config_io as conf
+from buzzwords import DEFAULT_RULES, BuzzFilter
+from dedupe import Deduper
+
+SUFFIXES = ["", "", "", " - Remastered 2011", " (feat. Someone)", " - Radio Edit",
+            " (Deluxe Version)", " - Acoustic"]
+
+def random_titles(count, seed=42):
+    """
+
+    Make up songs, some of them being versions of others
+
+    Returns
+    -------
+    List of (title, set of artist ids), about 20 songs per artist
+
+    """
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+             for _ in range(2000)]
+    artists = ["artist%d" % i for i in range(max(1, count // 20))]
+    songs = []
+    for _ in range(count):
+        if songs and rng.random() < 0.2:
+            title, artist_ids = rng.choice(songs)
+            songs.append((title + rng.choice(SUFFIXES), artist_ids))
+        else:
+            songs.append((" ".join(rng.choice(words)
+                                   for _ in range(rng.randint(1, 4))).title(),
+                          {rng.choice(artists)}))
+    return songs
+
+def timed(func, *args):
+    """
+
+    Run func once, return seconds it took
+
+    """
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def pairwise_dedupe(songs):
+    """
+
+    The old way: compare every title against every other
+
+    """
+    kept = []
+    for title, _ in songs:
+        if not any(difflib.SequenceMatcher(a=other.lower(), b=title.lower()).ratio() > 0.9
+                   for other in kept):
+            kept.append(title)
+    return kept
+
+def indexed_dedupe(songs):
+    """
+
+    The new way: normalized hash buckets plus MinHash candidates, per artist
+
+    Returns
+    -------
+    Number of fuzzy comparisons it took
+
+    """
+    deduper = Deduper()
+    for title, artist_ids in songs:
+        deduper.add(title, artist_ids)
+    return deduper.comparisons
+
+def bench_dedupe():
+    """
+
+    Compare pairwise and indexed dedupe, for growing numbers of titles
+
+    """
+    print("dedupe: titles, pairwise s, indexed s, fuzzy comparisons")
+    for count in (500, 1000, 2000, 4000, 8000, 16000, 32000):
+        songs = random_titles(count)
+        pairwise = timed(pairwise_dedupe, songs) if count <= 1000 else float('nan')
+        start = time.perf_counter()
+        comparisons = indexed_dedupe(songs)
+        indexed = time.perf_counter() - start
+        print("%6d %10.3f %10.3f %8d" % (count, pairwise, indexed, comparisons))
+
+def random_albums(count, seed=42):
+    """
+
+    Make up album dicts with release dates of all precisions
+
+    """
+    rng = random.Random(seed)
+    albums = []
+    for _ in range(count):
+        year, month, day = rng.randint(1990, 2026), rng.randint(1, 12), rng.randint(1, 28)
+        precision = rng.choice(['day', 'day', 'day', 'month', 'year'])
+        release_date = {'day': "%d-%02d-%02d" % (year, month, day),
+                        'month': "%d-%02d" % (year, month),
+                        'year': str(year)}[precision]
+        albums.append({'release_date': release_date, 'release_date_precision': precision})
+    return albums
+
+def bench_release_dates():
+    """
+
+    Compare strptime per album against the precompiled release date filter
+
+    """
+    albums = random_albums(200000)
+    cutoff = datetime(2020, 8, 28, 14, 0)
+    old = timed(lambda: [album for album in albums if conf.get_release_date(album) > cutoff])
+    new = timed(conf.ReleaseDateFilter(cutoff).filter, albums)
+    same = [album for album in albums if conf.get_release_date(album) > cutoff] == \
+           conf.ReleaseDateFilter(cutoff).filter(albums)
+    print("release dates: %d albums, strptime %.3f s, filter %.3f s, same result: %s"
+          % (len(albums), old, new, same))
+# Versions and extras, that show up in real track names
+TRACK_SUFFIXES = SUFFIXES + [" - Live", " (Live at Wembley)", " - Live From Berlin",
+                             " (Instrumental)", " - Interlude", " - Acoustic Version",
+                             " (RAC Mix)", " - LIVE", " (Live)", " - Demo"]
+
+def random_track_names(count, seed=42):
+    """
+
+    Make up track names, about a third with a version suffix, many of them repeated
+
+    """
+    rng = random.Random(seed)
+    titles = [title for title, _ in random_titles(count // 20 + 1, seed)]
+    return [rng.choice(titles) + rng.choice(TRACK_SUFFIXES) for _ in range(count)]
+
+def legacy_buzz_filter(string):
+    """
+
+    The old way: lists built and scanned on every call
+
+    """
+    buzzwords = ['LIVE', '- Live', '(Live']
+    buzzwords_lowercase = ['(live', ' - live', ' live version',
+                           ' live from', ' live in', ' live at', 'instrumental',
+                           'interlude', 'acoustic']
+    anti_buzzwords = ['RAC']
+    anti_buzzwords_lowercase = ['rac']
+    has_buzzwords = any(buzz in string for buzz in buzzwords)
+    has_anti_buzzwords = any(anti_buzz in string for anti_buzz in anti_buzzwords)
+    has_lowercase_buzzwords = any(buzz in string.lower() for buzz in buzzwords_lowercase)
+    has_lowercase_anti_buzzwords = any(anti_buzz in string.lower() \
+            for anti_buzz in anti_buzzwords_lowercase)
+    return (not has_buzzwords or has_anti_buzzwords ) and \
+           (not has_lowercase_buzzwords or has_lowercase_anti_buzzwords)
+
+def bench_buzzwords(count=2000000):
+    """
+
+    Compare the old buzzword filter against the compiled one, without and with memo
+
+    """
+    names = random_track_names(count)
+    unique = list(set(names))
+    old = timed(lambda: [legacy_buzz_filter(name) for name in names])
+    compiled = BuzzFilter(DEFAULT_RULES)
+    cold = timed(lambda: [compiled._keep(name) for name in names]) # pylint: disable=protected-access
+    memo = timed(compiled.keep_all, names)
+    # Names seen before, like the same albums coming up again
+    seen = names[:10000] * (count // 10000)
+    hot = timed(compiled.keep_all, seen)
+    same = [legacy_buzz_filter(name) for name in unique] == compiled.keep_all(unique)
+    print("buzzwords: %d names (%d different), names/s: old %.0f, compiled %.0f, "
+          "memoized %.0f, memoized and seen before %.0f, same result: %s"
+          % (count, len(unique), count / old, count / cold, count / memo, len(seen) / hot, same))
+
+
+# Must not be imported just by importing release_robbe
+LAZY_MODULES = ('pygame', 'spotipy', 'dialog', 'colorama', 'requests')
+# Check that the config wasn't read, and which lazy modules got imported anyway
+IMPORT_CHECK = ("import sys, release_robbe, config_io; "
+                "print(config_io.CONFIG._parser is not None, "
+                "*[name for name in %r if name in sys.modules])" % (LAZY_MODULES,))
+
+def bench_import(runs=5):
+    """
+
+    Time a cold `import release_robbe` in a fresh interpreter, against a bare one
+
+    Fails, if the import reads the config or imports one of the LAZY_MODULES.
+
+    """
+    def best_of(code):
+        return min(timed(subprocess.run, [sys.executable, '-c', code]) for _ in range(runs))
+    bare = best_of("pass")
+    startup = best_of("import release_robbe")
+    print("import: bare interpreter %.3f s, import release_robbe %.3f s (+%.3f s)"
+          % (bare, startup, startup - bare))
+    config_read, *imported = subprocess.run([sys.executable, '-c', IMPORT_CHECK], check=True,
+                                            capture_output=True, text=True).stdout.split()
+    if config_read == 'True' or imported:
+        sys.exit("import: regression, config read: %s, imported: %s"
+                 % (config_read, ", ".join(imported) or "-"))
+
+
+BENCHMARKS = {
+    'dedupe': bench_dedupe,
+    'release_dates': bench_release_dates,
+    'import': bench_import,
+    'buzzwords': bench_buzzwords,
+    }
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,123 @@
+"""
+
+Leave out live versions, instrumentals and the like, by their track name
+
+Subtasks:
+    - Read the buzzword rules from a JSON file
+    - Compile them once, so most names only take a single regex search
+    - Remember the result per track name
+    - Classify all track names of an album at once
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import functools
+import json
+import os
+import re
+import threading
+import config_io as conf
+
+# Used if there is no rules file
+DEFAULT_RULES = {
+    'buzzwords': ['LIVE', '- Live', '(Live'],
+    'buzzwords_ignore_case': ['(live', ' - live', ' live version', ' live from', ' live in',
+                              ' live at', 'instrumental', 'interlude', 'acoustic'],
+    'anti_buzzwords': ['RAC'],
+    'anti_buzzwords_ignore_case': ['rac'],
+    }
+# Number of track names to remember
+CACHE_SIZE = 1 << 16
+
+def load_rules(path):
+    """
+
+    Read rules from JSON file, the defaults if there is none
+
+    """
+    if not os.path.isfile(path):
+        return DEFAULT_RULES
+    with open(path, 'r') as rules_file:
+        rules = json.load(rules_file)
+    return {kind: rules.get(kind, []) for kind in DEFAULT_RULES}
+
+def compile_words(words):
+    """
+
+    Compile words into one regex, that finds any of them (and never matches without words)
+
+    """
+    if not words:
+        return re.compile(r"(?!)")
+    # Longest first, so no word is hidden by one of its prefixes
+    return re.compile("|".join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+class BuzzFilter:
+    """
+
+    Decide which track names to keep
+
+    A name is left out, if it has a buzzword, unless it also has an anti
+    buzzword of the same kind (case-sensitive or ignoring case).
+
+    Examples
+    --------
+    >>> buzz_filter = BuzzFilter(DEFAULT_RULES)
+    >>> buzz_filter.keep("Gangnam Style - Live at Seoul")
+    False
+    >>> buzz_filter.keep_all(["Gangnam Style", "Gangnam Style (Acoustic)"])
+    [True, False]
+    """
+
+    def __init__(self, rules):
+        self._buzz = compile_words(rules['buzzwords'])
+        self._anti = compile_words(rules['anti_buzzwords'])
+        # Ignoring case works on the lowered name, like str.lower() does it
+        self._buzz_ignore_case = compile_words([word.lower()
+                                                for word in rules['buzzwords_ignore_case']])
+        self._anti_ignore_case = compile_words([word.lower()
+                                                for word in rules['anti_buzzwords_ignore_case']])
+        # Any buzzword at all in the lowered name, the only search most names need
+        self._any = compile_words({word.lower() for word in
+                                   rules['buzzwords'] + rules['buzzwords_ignore_case']})
+        self.keep = functools.lru_cache(maxsize=CACHE_SIZE)(self._keep)
+
+    def _keep(self, name):
+        lowered = name.lower()
+        if self._any.search(lowered) is None:
+            return True
+        if self._buzz.search(name) and not self._anti.search(name):
+            return False
+        return not (self._buzz_ignore_case.search(lowered) and
+                    not self._anti_ignore_case.search(lowered))
+
+    def keep_all(self, names):
+        """
+
+        Decide for all names (e.g. of an album) at once
+
+        Returns
+        -------
+        List of bool, `True` for names to keep
+
+        """
+        keep = self.keep
+        return [keep(name) for name in names]
+
+
+_FILTER = None
+_FILTER_LOCK = threading.Lock()
+
+def get_buzz_filter():
+    """
+
+    Get the filter of this process, rules from the file in [Other] buzzwords
+
+    """
+    global _FILTER
+    with _FILTER_LOCK:
+        if _FILTER is None:
+            _FILTER = BuzzFilter(load_rules(conf.get_key('Other', 'buzzwords',
+                                                         fallback='buzzwords.json')))
+        return _FILTER
@@ -7,26 +7,188 @@ Author: Andreas Lindlbauer (@alindl)
 """
 
 import configparser
+import contextlib
+import os
 import re
+import shutil
+import tempfile
+import threading
+import time
 from datetime import datetime
 
+CONFIG_PATH = "release_robbe.conf"
+_UNSET = object()
+
+class Config:
+    """
+
+    Config file, parsed once and only parsed again if the file has changed
+
+    Changes are written right away, or once at the end of a `batch`.
+
+    Examples
+    --------
+    >>> config = Config("release_robbe.conf")
+    >>> config.get('Other', 'country')
+    'US'
+    >>> with config.batch():
+    ...     config.set('Other', 'country', 'AT')
+    ...     config.set('Other', 'source', 'saved')
+    """
+
+    # Don't look at the file's mtime more often than this (in seconds)
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, path=CONFIG_PATH):
+        self._path = path
+        self._lock = threading.RLock()
+        self._parser = None
+        self._mtime = None
+        self._checked = 0.0
+        self._typed = {}
+        self._batch_depth = 0
+        self._dirty = False
+
+    def _mtime_of_file(self):
+        try:
+            return os.stat(self._path).st_mtime_ns
+        except OSError:
+            return None
+
+    def parser(self):
+        """
+
+        Get parsed config, parse again if the file has changed since
+
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._parser is not None and now - self._checked < self.CHECK_INTERVAL:
+                return self._parser
+            self._checked = now
+            mtime = self._mtime_of_file()
+            if self._parser is None or (mtime != self._mtime and not self._dirty):
+                parser = configparser.ConfigParser()
+                parser.read(self._path)
+                self._parser = parser
+                self._mtime = mtime
+                self._typed = {}
+            return self._parser
+
+    def get(self, section, key, fallback=_UNSET):
+        """
+
+        Get key, or fallback if it's not there (if one is given)
+
+        """
+        if fallback is _UNSET:
+            return self.parser().get(section, key)
+        return self.parser().get(section, key, fallback=fallback)
+
+    def set(self, section, key, value):
+        """
+
+        Set key, write the file now, or at the end of the batch
+
+        """
+        with self._lock:
+            parser = self.parser()
+            if not parser.has_section(section):
+                parser.add_section(section)
+            parser[section][key] = value
+            self._typed = {}
+            self._dirty = True
+            if self._batch_depth == 0:
+                self._write()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+
+        Collect all `set`s within, and write them in one go at the end
+
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._dirty:
+                    self._write()
+
+    def _write(self):
+        """
+
+        Write config to a temporary file and rename it over the config file
+
+        """
+        directory = os.path.dirname(os.path.abspath(self._path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False,
+                                         prefix='.' + os.path.basename(self._path)) as configfile:
+            self._parser.write(configfile)
+        # The temporary file is only readable by us, keep the permissions of the config
+        if os.path.isfile(self._path):
+            shutil.copymode(self._path, configfile.name)
+        os.replace(configfile.name, self._path)
+        self._mtime = self._mtime_of_file()
+        self._dirty = False
+
+    def _get_typed(self, name, convert):
+        with self._lock:
+            self.parser()
+            if name not in self._typed:
+                self._typed[name] = convert()
+            return self._typed[name]
+
+    def cutoff(self):
+        """
+
+        Get last time this program was used as datetime, today at midnight if never
+
+        """
+        def convert():
+            last_check = self.get('Other', 'last_check', fallback='')
+            if last_check:
+                return datetime.fromtimestamp(float(last_check))
+            return datetime.combine(datetime.today().date(), datetime.min.time())
+        return self._get_typed('cutoff', convert)
+
+    def country(self):
+        """
+
+        Get country, US if not set
+
+        """
+        return self._get_typed('country',
+                               lambda: self.get('Other', 'country', fallback='') or "US")
+
+    def source(self):
+        """
+
+        Get source of artists
+
+        """
+        return self._get_typed('source', lambda: self.get('Other', 'source', fallback=''))
+
+
+CONFIG = Config()
+
 def get_config():
     """
 
-    Load config file
+    Get parsed config file
 
     """
-    config = configparser.ConfigParser()
-    config.read("release_robbe.conf")
-    return config
+    return CONFIG.parser()
 
-def get_key(section, key):
+def get_key(section, key, fallback=_UNSET):
     """
 
-    Get key from config file
+    Get key from config file, or fallback if it's not there (if one is given)
 
     """
-    return get_config().get(section, key)
+    return CONFIG.get(section, key, fallback)
 
 def set_key(section, key, value):
     """
@@ -34,10 +196,20 @@ def set_key(section, key, value):
     Set key from config file
 
     """
-    config = get_config()
-    config[section][key] = value
-    with open('release_robbe.conf', 'w') as configfile:
-        config.write(configfile)
+    CONFIG.set(section, key, value)
+
+def batch():
+    """
+
+    Write all set_key calls within in one go
+
+    Examples
+    --------
+    >>> with batch():
+    ...     set_key('Other', 'country', 'AT')
+    ...     set_key('Other', 'source', 'saved')
+    """
+    return CONFIG.batch()
 
 def get_section(section):
     """
@@ -77,10 +249,7 @@ def read_time():
     Read last time, this program was used, so we don't get duplicates
 
     """
-    last_check = get_key('Other', 'last_check')
-    if last_check:
-        return datetime.fromtimestamp(float(last_check))
-    return datetime.today().date()
+    return CONFIG.cutoff()
     #return datetime(2019, 8, 3)
     # If there's no date, just use the date one year ago
     #last_check = datetime.today().date()
@@ -91,13 +260,15 @@ def read_time():
     #return last_check
 
 
-def write_time():
+def write_time(timestamp=None):
     """
 
-    Write time of usage
+    Write time of usage, or timestamp if given
 
     """
-    set_key('Other', 'last_check', str(datetime.now().timestamp()))
+    if timestamp is None:
+        timestamp = datetime.now()
+    set_key('Other', 'last_check', str(timestamp.timestamp()))
 
 def get_release_date(album):
     """
@@ -114,6 +285,143 @@ def get_release_date(album):
         pass
     return datetime.strptime(album['release_date'], out_format)
 
+class ReleaseDateFilter:
+    """
+
+    Check raw release dates of albums against a cutoff, without parsing them
+
+    A release counts as new, if it was released after the day of the cutoff,
+    same as `get_release_date(album) > cutoff`. Dates with year or month
+    precision count as the first day of it, so e.g. '2020-08' is new if the
+    cutoff is in July 2020 or before, but not if it is in August 2020.
+    ISO dates sort like strings, so comparing against the cutoff cut down to
+    the same precision is enough. The optional until day works the same way,
+    releases on that day are still included.
+
+    Examples
+    --------
+    >>> release_filter = ReleaseDateFilter(datetime(2020, 8, 28, 14, 0))
+    >>> release_filter.is_new({'release_date': '2020-08-29', 'release_date_precision': 'day'})
+    True
+    >>> release_filter.is_new({'release_date': '2020-08', 'release_date_precision': 'month'})
+    False
+    """
+
+    def __init__(self, cutoff, until=None):
+        iso = convert_dt_to_iso(cutoff)
+        self._after = {'day': iso, 'month': iso[:7], 'year': iso[:4]}
+        self._until = None
+        if until is not None:
+            iso = convert_dt_to_iso(until)
+            self._until = {'day': iso, 'month': iso[:7], 'year': iso[:4]}
+
+    @property
+    def cutoff(self):
+        """ Day of the cutoff, as YYYY-MM-DD """
+        return self._after['day']
+
+    def is_new(self, album):
+        """
+
+        Check if album was released after the cutoff (and up to until, if given)
+
+        """
+        return bool(self.filter([album]))
+
+    def filter(self, albums):
+        """
+
+        Get all albums released after the cutoff (and up to until, if given), in one pass
+
+        """
+        after = self._after
+        return self.until_filter([album for album in albums
+                                  if album['release_date'] >
+                                  after.get(album['release_date_precision'], after['day'])])
+
+    def until_filter(self, albums):
+        """
+
+        Get all albums released up to until, all of them if there is no until
+
+        """
+        until = self._until
+        if until is None:
+            return albums
+        return [album for album in albums
+                if album['release_date'] <= until.get(album['release_date_precision'],
+                                                      until['day'])]
+
+def get_workers():
+    """
+
+    Get number of worker threads for fetching from Spotify
+
+    """
+    workers = get_key('Other', 'workers', fallback='')
+    if workers.isdigit() and int(workers) > 0:
+        return int(workers)
+    return 8
+
+def get_cache_size():
+    """
+
+    Get maximum size of the response cache in bytes, configured in MB
+
+    """
+    size = get_key('Cache', 'max_size', fallback='')
+    if size.isdigit():
+        return int(size) * 1024 * 1024
+    return 200 * 1024 * 1024
+
+def get_albums_ttl():
+    """
+
+    Get how long cached album listings of artists stay valid in seconds, configured in hours
+
+    """
+    ttl = get_key('Cache', 'artist_albums_ttl', fallback='')
+    if ttl.isdigit():
+        return int(ttl) * 60 * 60
+    return 12 * 60 * 60
+
+def get_search_miss_ttl():
+    """
+
+    Get how long names without a search match are remembered in seconds, configured in hours
+
+    """
+    ttl = get_key('Cache', 'artist_search_miss_ttl', fallback='')
+    if ttl.isdigit():
+        return int(ttl) * 60 * 60
+    return 7 * 24 * 60 * 60
+
+def get_top_tracks_ttl():
+    """
+
+    Get how long cached top tracks of artists stay valid in seconds, configured in hours
+
+    """
+    ttl = get_key('Cache', 'top_tracks_ttl', fallback='')
+    if ttl.isdigit():
+        return int(ttl) * 60 * 60
+    return 7 * 24 * 60 * 60
+
+def get_isrc_dedupe():
+    """
+
+    Get which release of a recording to keep, if songs are deduplicated by ISRC
+
+    Returns
+    -------
+    'earliest' or 'album', `None` if it's off
+
+    """
+    prefer = get_key('Other', 'isrc_dedupe', fallback='').strip().lower()
+    if prefer in ('earliest', 'album'):
+        return prefer
+    return None
+
 def get_credentials():
     """
 
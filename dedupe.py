@@ -0,0 +1,271 @@
+"""
+
+Find duplicate songs by their title
+
+Subtasks:
+    - Normalize titles (feat., remaster, edit, version suffixes)
+    - Exact matches on normalized titles through a hash map
+    - Fuzzy matches through a MinHash index, only likely pairs get compared
+    - Same recordings by their ISRC, keeping the preferred release
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import difflib
+import re
+import threading
+
+# Suffixes in brackets or after a dash, that don't make it a different song
+SUFFIX_PATTERN = re.compile(
+    r"\s*(?:[\(\[](?:feat\.?|ft\.?|featuring|with)\s[^\)\]]*[\)\]]"
+    r"|[\(\[][^\)\]]*(?:remaster(?:ed)?|edit|version|mono|stereo|deluxe)[^\)\]]*[\)\]]"
+    r"|\s-\s.*(?:remaster(?:ed)?|edit|version|mono|stereo).*$"
+    r"|\s(?:feat\.?|ft\.?|featuring)\s.*$)")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+SPACE_PATTERN = re.compile(r"\s+")
+
+# Release dates sort as strings, unknown ones last
+UNKNOWN_DATE = "9999"
+
+# 6 bands of 3 rows: titles with trigram Jaccard similarity 0.8 end up as
+# candidates 98% of the time, 0.6 still 77%, unrelated ones (0.2) 5%
+NUM_HASHES = 18
+ROWS_PER_BAND = 3
+SIMILARITY = 0.9
+# Only compare against the newest songs of a bucket
+MAX_BUCKET_SCAN = 64
+# Index keys besides artist ids: songs without artists, and all songs
+NO_ARTISTS = None
+ANY_ARTIST = '*'
+
+def normalize_title(title):
+    """
+
+    Normalize title, so versions of the same song end up the same
+
+    Examples
+    --------
+    >>> normalize_title("Gangnam Style (feat. Someone) - Remastered 2012")
+    'gangnam style'
+    >>> normalize_title("Gangnam Style - Radio Edit")
+    'gangnam style'
+    """
+    title = title.casefold()
+    previous = None
+    while previous != title:
+        previous = title
+        title = SUFFIX_PATTERN.sub("", title)
+    title = PUNCTUATION_PATTERN.sub(" ", title)
+    return SPACE_PATTERN.sub(" ", title).strip()
+
+def minhash(title):
+    """
+
+    MinHash signature of the character trigrams of a title
+
+    """
+    grams = {title[i:i+3] for i in range(max(1, len(title) - 2))}
+    return tuple(min(hash((seed, gram)) for gram in grams) for seed in range(NUM_HASHES))
+
+def release_rank(release_date, album_type, prefer='earliest'):
+    """
+
+    Sort key of a release of a recording, the lowest one is kept
+
+    Parameters
+    ----------
+    release_date : str, YYYY, YYYY-MM or YYYY-MM-DD
+    album_type : str, 'album', 'single' or 'compilation'
+    prefer : str, 'earliest' release, or 'album' for the earliest album, before singles
+
+    Examples
+    --------
+    >>> release_rank('2012-07-15', 'single') < release_rank('2012-12-31', 'album')
+    True
+    >>> release_rank('2012-07-15', 'single', 'album') < release_rank('2012-12-31', 'album', 'album')
+    False
+    """
+    release_date = release_date or UNKNOWN_DATE
+    if prefer == 'album':
+        return (album_type != 'album', release_date)
+    return (release_date,)
+
+class Deduper:
+    """
+
+    Keep track of all songs of a run, to find duplicates in one pass
+
+    A song is a duplicate, if one of its artists also has a song with the same
+    normalized title, or one that is at least 90% similar. Songs without
+    artists are compared to all songs. Both indexes are kept per artist, so
+    a song only gets compared to songs of its own artists.
+
+    Examples
+    --------
+    >>> deduper = Deduper()
+    >>> deduper.add("Gangnam Style", {'2dd5mrQZvg6SmahdgVKDzh'})
+    True
+    >>> deduper.add("Gangnam Style - Radio Edit", {'2dd5mrQZvg6SmahdgVKDzh'})
+    False
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._titles = []
+        self._songs = []
+        self._exact = {}
+        self._bands = {}
+        self.comparisons = 0
+
+    def clear(self):
+        """
+
+        Forget all songs
+
+        """
+        with self._lock:
+            self._titles = []
+            self._songs = []
+            self._exact = {}
+            self._bands = {}
+            self.comparisons = 0
+
+    @staticmethod
+    def _lookup_keys(artist_ids):
+        """
+
+        Index keys to look for duplicates: the artists and songs without artists, or all songs
+
+        """
+        if artist_ids:
+            return list(artist_ids) + [NO_ARTISTS]
+        return [ANY_ARTIST]
+
+    @staticmethod
+    def _index_keys(artist_ids):
+        return list(artist_ids or [NO_ARTISTS]) + [ANY_ARTIST]
+
+    def add(self, title, artist_ids=()):
+        """
+
+        Add song, if it's not a duplicate
+
+        Parameters
+        ----------
+        title : str
+        artist_ids : Set of the ids of the artists of the song
+
+        Returns
+        -------
+        `True` if it was added, `False` if it's a duplicate.
+
+        """
+        return self.add_or_find(title, artist_ids)[0]
+
+    def add_or_find(self, title, artist_ids=(), song=None):
+        """
+
+        Add song, if it's not a duplicate, otherwise find the song it duplicates
+
+        Parameters
+        ----------
+        title : str
+        artist_ids : Set of the ids of the artists of the song
+        song : Anything to remember with the song, e.g. the track
+
+        Returns
+        -------
+        (`True`, `None`) if it was added, (`False`, song given for the
+        earlier song) if it's a duplicate.
+
+        Examples
+        --------
+        >>> deduper = Deduper()
+        >>> deduper.add_or_find("Gangnam Style", {'2dd5mrQZvg6SmahdgVKDzh'}, 'single')
+        (True, None)
+        >>> deduper.add_or_find("Gangnam Style", {'2dd5mrQZvg6SmahdgVKDzh'}, 'album')
+        (False, 'single')
+        """
+        title = normalize_title(title)
+        lookup_keys = self._lookup_keys(artist_ids)
+        with self._lock:
+            for key in lookup_keys:
+                idx = self._exact.get((key, title))
+                if idx is not None:
+                    return False, self._songs[idx]
+            signature = minhash(title)
+            bands = [(band, signature[band:band + ROWS_PER_BAND])
+                     for band in range(0, NUM_HASHES, ROWS_PER_BAND)]
+            candidates = set()
+            for key in lookup_keys:
+                for band in bands:
+                    candidates.update(self._bands.get((key, band), ())[-MAX_BUCKET_SCAN:])
+            for idx in candidates:
+                self.comparisons += 1
+                if difflib.SequenceMatcher(a=self._titles[idx], b=title).ratio() > SIMILARITY:
+                    return False, self._songs[idx]
+            idx = len(self._titles)
+            self._titles.append(title)
+            self._songs.append(song)
+            for key in self._index_keys(artist_ids):
+                self._exact[(key, title)] = idx
+                for band in bands:
+                    self._bands.setdefault((key, band), []).append(idx)
+            return True, None
+
+
+class IsrcDeduper:
+    """
+
+    Keep track of the recordings of a run, by their ISRC
+
+    Songs are joined on their ISRC, a hash map from ISRC to the best ranked
+    song. Of songs added together the preferred release is kept, a recording
+    that was added before keeps the song it had.
+
+    Examples
+    --------
+    >>> deduper = IsrcDeduper()
+    >>> deduper.select([('single', 'KRA381200001', ('2012-07-15',)),
+    ...                 ('album', 'KRA381200001', ('2012-10-15',))])
+    ['single']
+    >>> deduper.select([('deluxe', 'KRA381200001', ('2013-01-01',))])
+    []
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._isrcs = set()
+
+    def clear(self):
+        """
+
+        Forget all recordings
+
+        """
+        with self._lock:
+            self._isrcs = set()
+
+    def select(self, songs):
+        """
+
+        Keep one song per recording, that wasn't added before
+
+        Parameters
+        ----------
+        songs : List of (song, ISRC, rank), see release_rank
+
+        Returns
+        -------
+        List of the songs to keep
+
+        """
+        best = {}
+        for song, isrc, rank in songs:
+            if isrc not in best or rank < best[isrc][1]:
+                best[isrc] = (song, rank)
+        with self._lock:
+            kept = [song for isrc, (song, _) in best.items() if isrc not in self._isrcs]
+            self._isrcs.update(best)
+        return kept
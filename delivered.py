@@ -0,0 +1,316 @@
+"""
+
+Remember every track and album that already made it into a playlist
+
+Spotify IDs are base62 encoded 128-bit numbers, so each one is kept as
+16 bytes in a sorted array, with a Bloom filter in front. Most IDs we ask
+about were never delivered, and the Bloom filter answers those without a
+search. Both are kept in one file.
+
+Subtasks:
+    - Decode Spotify IDs and URIs to 16 bytes
+    - Sorted array with binary search, merged with new IDs on commit
+    - Bloom filter, grown when it gets too full
+    - Only keep new IDs once their run (or write) was successful
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import os
+import struct
+import tempfile
+import threading
+import config_io as conf
+
+BASE62 = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_DIGITS = {char: value for value, char in enumerate(BASE62)}
+ID_SIZE = 16
+# Bloom filter: bits per ID it's sized for, and bits set per ID (about 1% false positives)
+BITS_PER_ID = 10
+HASHES = 7
+MIN_CAPACITY = 1 << 14
+FILE_MAGIC = b"RRD1"
+
+def decode_id(spotify_id):
+    """
+
+    Decode base62 Spotify ID (or URI) to 16 bytes, `None` if it's not one
+
+    Examples
+    --------
+    >>> decode_id('spotify:track:4uLU6hMCjMI75M1A2tKUQC').hex()
+    '93bc414a606747b2b612491ef83d5a3e'
+    """
+    spotify_id = spotify_id.rpartition(':')[2]
+    if len(spotify_id) != 22:
+        return None
+    number = 0
+    try:
+        for char in spotify_id:
+            number = number * 62 + _DIGITS[char]
+    except KeyError:
+        return None
+    if number >> 128:
+        return None
+    return number.to_bytes(ID_SIZE, 'big')
+
+
+class IdSet:
+    """
+
+    Set of 16 byte IDs: sorted array, Bloom filter in front, and pending IDs
+
+    """
+
+    def __init__(self, keys=b"", bloom=None):
+        self._keys = keys
+        self._pending = set()
+        if bloom is None or len(bloom) * 8 < len(self) * BITS_PER_ID:
+            self._build_bloom(max(MIN_CAPACITY, 2 * len(self)))
+        else:
+            self._bloom = bytearray(bloom)
+
+    def __len__(self):
+        return len(self._keys) // ID_SIZE
+
+    @staticmethod
+    def _positions(key, bits):
+        number = int.from_bytes(key, 'big')
+        first, second = number & 0xFFFFFFFFFFFFFFFF, (number >> 64) | 1
+        return [(first + i * second) % bits for i in range(HASHES)]
+
+    def _set_bits(self, key):
+        for position in self._positions(key, len(self._bloom) * 8):
+            self._bloom[position >> 3] |= 1 << (position & 7)
+
+    def _build_bloom(self, capacity):
+        self._bloom = bytearray(capacity * BITS_PER_ID // 8)
+        keys = self._keys
+        for start in range(0, len(keys), ID_SIZE):
+            self._set_bits(keys[start:start + ID_SIZE])
+
+    def _search(self, key):
+        """
+
+        Binary search in the sorted array, index where key is or would go
+
+        """
+        keys = self._keys
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if keys[mid * ID_SIZE:(mid + 1) * ID_SIZE] < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def __contains__(self, key):
+        if key in self._pending:
+            return True
+        bloom = self._bloom
+        for position in self._positions(key, len(bloom) * 8):
+            if not bloom[position >> 3] & (1 << (position & 7)):
+                return False
+        idx = self._search(key)
+        return self._keys[idx * ID_SIZE:(idx + 1) * ID_SIZE] == key
+
+    def add(self, key):
+        """
+
+        Add key, until `merge` or `discard`
+
+        """
+        self._pending.add(key)
+
+    def merge(self):
+        """
+
+        Merge pending keys into the sorted array and the Bloom filter
+
+        """
+        keys = self._keys
+        if len(self._pending) * 16 > len(self):
+            # Many new keys, sorting everything at once is faster than searching each
+            known = {keys[start:start + ID_SIZE] for start in range(0, len(keys), ID_SIZE)}
+            new = self._pending - known
+            self._pending = set()
+            if new:
+                self._keys = b"".join(sorted(known | new))
+                self._add_bloom(new)
+            return
+        parts = []
+        new = []
+        previous = 0
+        for key in sorted(self._pending):
+            idx = self._search(key)
+            if keys[idx * ID_SIZE:(idx + 1) * ID_SIZE] == key:
+                continue
+            parts.append(keys[previous * ID_SIZE:idx * ID_SIZE])
+            parts.append(key)
+            new.append(key)
+            previous = idx
+        self._pending = set()
+        if not new:
+            return
+        parts.append(keys[previous * ID_SIZE:])
+        self._keys = b"".join(parts)
+        self._add_bloom(new)
+
+    def _add_bloom(self, new):
+        """
+
+        Set the bits of new keys, or grow the Bloom filter if it got too full
+
+        """
+        if len(self._bloom) * 8 < len(self) * BITS_PER_ID:
+            self._build_bloom(2 * len(self))
+        else:
+            for key in new:
+                self._set_bits(key)
+
+    def discard(self):
+        """
+
+        Forget pending keys
+
+        """
+        self._pending = set()
+
+    def to_bytes(self):
+        """
+
+        Serialize Bloom filter and sorted array (not the pending keys)
+
+        """
+        return struct.pack(">QQ", len(self), len(self._bloom)) + bytes(self._bloom) + self._keys
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """
+
+        Read an IdSet written by to_bytes, at offset
+
+        Returns
+        -------
+        (IdSet, offset after it)
+
+        """
+        count, bloom_size = struct.unpack_from(">QQ", data, offset)
+        offset += 16
+        bloom = data[offset:offset + bloom_size]
+        offset += bloom_size
+        keys = data[offset:offset + count * ID_SIZE]
+        return cls(keys, bloom), offset + count * ID_SIZE
+
+
+class DeliveredIndex:
+    """
+
+    Tracks and albums that were already delivered into a playlist, kept in one file
+
+    Examples
+    --------
+    >>> delivered = DeliveredIndex("delivered.bin")
+    >>> delivered.add_tracks(['spotify:track:4uLU6hMCjMI75M1A2tKUQC'])
+    >>> delivered.commit()
+    >>> delivered.has_track('spotify:track:4uLU6hMCjMI75M1A2tKUQC')
+    True
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self.tracks = IdSet()
+        self.albums = IdSet()
+        if os.path.isfile(path):
+            with open(path, 'rb') as delivered_file:
+                data = delivered_file.read()
+            if data[:len(FILE_MAGIC)] == FILE_MAGIC:
+                self.tracks, offset = IdSet.from_bytes(data, len(FILE_MAGIC))
+                self.albums, _ = IdSet.from_bytes(data, offset)
+
+    def has_track(self, track_uri):
+        """
+
+        Check if track (URI or ID) was delivered before
+
+        """
+        key = decode_id(track_uri)
+        return key is not None and key in self.tracks
+
+    def has_album(self, album_id):
+        """
+
+        Check if all tracks of album were delivered before
+
+        """
+        key = decode_id(album_id)
+        return key is not None and key in self.albums
+
+    def _add(self, id_set, spotify_ids):
+        with self._lock:
+            for spotify_id in spotify_ids:
+                key = decode_id(spotify_id)
+                if key is not None:
+                    id_set.add(key)
+
+    def add_tracks(self, track_uris):
+        """
+
+        Remember tracks (URIs or IDs) as delivered, once committed
+
+        """
+        self._add(self.tracks, track_uris)
+
+    def add_albums(self, album_ids):
+        """
+
+        Remember albums as delivered, once committed
+
+        """
+        self._add(self.albums, album_ids)
+
+    def commit(self, albums=True):
+        """
+
+        Keep new tracks (and albums) and write them to disk
+
+        Parameters
+        ----------
+        albums : bool, `False` to forget new albums, e.g. if the run failed
+                 halfway and some of their tracks never made it
+
+        """
+        with self._lock:
+            self.tracks.merge()
+            if albums:
+                self.albums.merge()
+            else:
+                self.albums.discard()
+            directory = os.path.dirname(os.path.abspath(self._path))
+            with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False,
+                                             prefix='.' + os.path.basename(self._path)) \
+                    as delivered_file:
+                delivered_file.write(FILE_MAGIC)
+                delivered_file.write(self.tracks.to_bytes())
+                delivered_file.write(self.albums.to_bytes())
+            os.replace(delivered_file.name, self._path)
+
+
+_DELIVERED = None
+_DELIVERED_LOCK = threading.Lock()
+
+def get_delivered():
+    """
+
+    Get the delivered index of this process, file configured in [Other] delivered
+
+    """
+    global _DELIVERED
+    with _DELIVERED_LOCK:
+        if _DELIVERED is None:
+            _DELIVERED = DeliveredIndex(conf.get_key('Other', 'delivered',
+                                                     fallback='delivered.bin'))
+        return _DELIVERED
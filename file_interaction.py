@@ -4,7 +4,9 @@ All kinds of file interactions
 
 Subtasks:
     - Manage blocklist, allowlist, greylist
-    - Search on lists using binary search
+    - Keep lists in memory, sorted and indexed by id and name
+    - Write changed lists back once, atomically
+    - Optionally keep the lists in SQLite instead of CSV files
     - Add missing ids
     - Manage reading and writing the timestamps
     - Get correct format for release date
@@ -14,8 +16,13 @@ Author: Andreas Lindlbauer (@alindl)
 
 """
 from enum import Enum
+import bisect
+import os
 import re
 import csv
+import shutil
+import sqlite3
+import tempfile
 import config_io as conf
 
 class Lists(Enum):
@@ -23,17 +30,464 @@ class Lists(Enum):
 
     Enum to represent the different lists
 
+    The values are the keys in [Lists], the file is only looked up in the
+    config once it's needed (see `path`).
+
     """
-    BLOCKLIST = conf.get_key("Lists", "blocklist")
-    ALLOWLIST = conf.get_key("Lists", "allowlist")
-    GREYLIST = conf.get_key("Lists", "greylist")
+    BLOCKLIST = "blocklist"
+    ALLOWLIST = "allowlist"
+    GREYLIST = "greylist"
     DELETE = "delete"
 
+    @property
+    def path(self):
+        """ CSV file of the list, as configured in [Lists] """
+        return conf.get_key("Lists", self.value)
+
+
+class CsvBackend:
+    """
+
+    Keep each list in its own `;`-delimited file, at the path of the list
+
+    """
+
+    def __init__(self):
+        self._on_disk = {}
+
+    def load(self, list_name):
+        """
+
+        Read all rows of a list
+
+        """
+        rows = []
+        path = list_name.path
+        if os.path.isfile(path):
+            with open(path, 'r') as this_list:
+                rows = [row for row in csv.reader(this_list, delimiter=';') if row]
+        self._on_disk[list_name] = rows
+        return rows
+
+    def flush(self, changed, journal):
+        """
+
+        Write every changed list that differs from what's on disk
+
+        Each list is written to a temporary file next to it first and then
+        renamed over the old one.
+
+        Returns
+        -------
+        Number of lists that were written
+
+        """
+        written = 0
+        for list_name, rows in changed.items():
+            if rows == self._on_disk.get(list_name):
+                continue
+            write_csv_atomically(list_name.path, rows)
+            self._on_disk[list_name] = [list(row) for row in rows]
+            written += 1
+        return written
+
+
+class SqliteBackend:
+    """
+
+    Keep all lists in one SQLite table, with a column for the list
+
+    Lists which aren't in the database yet get imported from their CSV file
+    on first use. Changes are applied in one transaction per flush, so
+    moving an artist between lists either happens completely or not at all.
+
+    """
+
+    def __init__(self, database):
+        self._conn = sqlite3.connect(database)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS artists ("
+                               "list TEXT NOT NULL, "
+                               "name TEXT NOT NULL, "
+                               "artist_id TEXT, "
+                               "name_key TEXT NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS artists_id "
+                               "ON artists (artist_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS artists_name_key "
+                               "ON artists (name_key)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS imported ("
+                               "list TEXT PRIMARY KEY)")
+
+    @staticmethod
+    def _row_values(list_name, row):
+        """
+
+        Turn list row into values for the artists table
+
+        """
+        return (list_name.name, row[0], row[1] if len(row) == 2 else None, row[0].casefold())
+
+    def _import_csv(self, list_name):
+        """
+
+        Import list from its CSV file, if it hasn't been imported yet
+
+        """
+        if self._conn.execute("SELECT 1 FROM imported WHERE list = ?",
+                              (list_name.name,)).fetchone():
+            return
+        rows = CsvBackend().load(list_name)
+        with self._conn:
+            self._conn.executemany("INSERT INTO artists VALUES (?, ?, ?, ?)",
+                                   [self._row_values(list_name, row) for row in rows])
+            self._conn.execute("INSERT INTO imported VALUES (?)", (list_name.name,))
+
+    def load(self, list_name):
+        """
+
+        Read all rows of a list
+
+        """
+        self._import_csv(list_name)
+        cursor = self._conn.execute("SELECT name, artist_id FROM artists "
+                                    "WHERE list = ? ORDER BY name_key", (list_name.name,))
+        return [[name] if artist_id is None else [name, artist_id]
+                for name, artist_id in cursor]
+
+    def _delete_row(self, list_name, row):
+        """
+
+        Delete a single row
+
+        """
+        _, name, artist_id, _ = self._row_values(list_name, row)
+        self._conn.execute("DELETE FROM artists WHERE rowid = ("
+                           "SELECT rowid FROM artists "
+                           "WHERE list = ? AND name = ? AND artist_id IS ? LIMIT 1)",
+                           (list_name.name, name, artist_id))
+
+    def flush(self, changed, journal):
+        """
+
+        Apply the journal of changes in one transaction
+
+        Returns
+        -------
+        Number of lists that were changed
+
+        """
+        if not journal:
+            return 0
+        with self._conn:
+            for operation, list_name, row in journal:
+                if operation == 'add':
+                    self._conn.execute("INSERT INTO artists VALUES (?, ?, ?, ?)",
+                                       self._row_values(list_name, row))
+                else:
+                    self._delete_row(list_name, row)
+        return len({list_name for _, list_name, _ in journal})
+
+    def export(self, list_name, path):
+        """
+
+        Write a list back into a CSV file
+
+        """
+        write_csv_atomically(path, self.load(list_name))
+
+
+def get_backend():
+    """
+
+    Create storage backend, as configured in [Lists] backend
+
+    """
+    if conf.get_key("Lists", "backend", fallback="csv") == "sqlite":
+        return SqliteBackend(conf.get_key("Lists", "database", fallback="lists.db"))
+    return CsvBackend()
+
+
+def write_csv_atomically(path, rows):
+    """
+
+    Write rows to a temporary file next to path, then rename it over path
+
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False,
+                                     prefix='.' + os.path.basename(path),
+                                     newline='') as this_list:
+        write_csv = csv.writer(this_list, delimiter=';', lineterminator='\n')
+        write_csv.writerows(rows)
+    if os.path.isfile(path):
+        shutil.copymode(path, this_list.name)
+    os.replace(this_list.name, path)
+
+
+class ListStore:
+    """
+
+    In-memory copy of the artist lists
+
+    Every list is read from the backend once and then kept sorted by
+    casefolded name, with one index by Spotify ID and one by casefolded name,
+    so lookups don't touch the disk. Changes are written behind: they go into
+    a journal and stay in memory until `flush` hands them to the backend once.
+
+    Examples
+    --------
+    >>> store = ListStore()
+    >>> store.find(Lists.BLOCKLIST, ['PSY', '2dd5mrQZvg6SmahdgVKDzh'])
+    ['PSY', '2dd5mrQZvg6SmahdgVKDzh']
+    >>> store.flush()
+    0
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._rows = {}
+        self._keys = {}
+        self._by_id = {}
+        self._by_name = {}
+        self._journal = []
+        self._dirty = set()
+
+    @property
+    def backend(self):
+        """
+
+        Storage backend, created from the config on first use
+
+        """
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    def _load(self, list_name):
+        """
+
+        Read list from backend, if that didn't happen yet, and build the indexes
+
+        """
+        if list_name not in self._rows:
+            loaded = self.backend.load(list_name)
+            rows = sorted(loaded, key=lambda x: x[0].casefold())
+            self._rows[list_name] = rows
+            self._keys[list_name] = [row[0].casefold() for row in rows]
+            self._reindex(list_name)
+            if rows != loaded:
+                # Unsorted on disk, write it back sorted once
+                self._dirty.add(list_name)
+        return self._rows[list_name]
+
+    def _reindex(self, list_name):
+        """
+
+        Rebuild id and name index of one list
+
+        """
+        by_id = {}
+        by_name = {}
+        for row in self._rows[list_name]:
+            if len(row) == 2:
+                by_id.setdefault(row[1], row)
+            by_name.setdefault(row[0].casefold(), row)
+        self._by_id[list_name] = by_id
+        self._by_name[list_name] = by_name
+
+    def rows(self, list_name):
+        """
+
+        Get copies of all rows of a list
+
+        """
+        return [list(row) for row in self._load(list_name)]
+
+    def ids(self, list_name):
+        """
+
+        Get all ids on a list, as set
+
+        """
+        self._load(list_name)
+        return set(self._by_id[list_name])
+
+    def find(self, list_name, artist):
+        """
+
+        Look up artist by id first and by casefolded name second
+
+        Parameters
+        ----------
+        list_name : Lists Enum
+        artist : List [str(,str)] or str
+
+        Returns
+        -------
+        Copy of the entry if found, otherwise `None`.
+
+        """
+        self._load(list_name)
+        if isinstance(artist, str):
+            artist = [artist]
+        if len(artist) == 2 and artist[1] in self._by_id[list_name]:
+            return list(self._by_id[list_name][artist[1]])
+        entry = self._by_name[list_name].get(artist[0].casefold())
+        if entry is None:
+            return None
+        return list(entry)
+
+    def add(self, list_name, entry):
+        """
+
+        Insert entry at its sorted position
+
+        """
+        rows = self._load(list_name)
+        row = list(entry)
+        key = row[0].casefold()
+        idx = bisect.bisect_right(self._keys[list_name], key)
+        rows.insert(idx, row)
+        self._keys[list_name].insert(idx, key)
+        if len(row) == 2:
+            self._by_id[list_name].setdefault(row[1], row)
+        self._by_name[list_name].setdefault(key, row)
+        self._journal.append(('add', list_name, row))
+        self._dirty.add(list_name)
+
+    def remove(self, list_name, match):
+        """
+
+        Remove all rows for which `match(row)` is true
+
+        Returns
+        -------
+        Number of removed rows
+
+        """
+        rows = self._load(list_name)
+        kept = []
+        for row in rows:
+            if match(row):
+                self._journal.append(('remove', list_name, row))
+            else:
+                kept.append(row)
+        removed = len(rows) - len(kept)
+        if removed:
+            self._rows[list_name] = kept
+            self._keys[list_name] = [row[0].casefold() for row in kept]
+            self._reindex(list_name)
+            self._dirty.add(list_name)
+        return removed
+
+    def replace(self, list_name, match, entry):
+        """
+
+        Replace first row for which `match(row)` is true with entry
+
+        Returns
+        -------
+        `True` if a row was replaced, otherwise `False`.
+
+        """
+        rows = self._load(list_name)
+        for idx, row in enumerate(rows):
+            if match(row):
+                del rows[idx]
+                del self._keys[list_name][idx]
+                self._reindex(list_name)
+                self._journal.append(('remove', list_name, row))
+                self.add(list_name, entry)
+                return True
+        return False
+
+    def add_ids(self, list_name, ids_by_name):
+        """
+
+        Give every row without id the id of its name, in one pass
+
+        Parameters
+        ----------
+        list_name : Lists Enum
+        ids_by_name : Dict of name to id
+
+        Returns
+        -------
+        Number of rows that got an id
+
+        """
+        rows = self._load(list_name)
+        changed = 0
+        for idx, row in enumerate(rows):
+            if len(row) == 1 and row[0] in ids_by_name:
+                entry = [row[0], ids_by_name[row[0]]]
+                self._journal.append(('remove', list_name, row))
+                self._journal.append(('add', list_name, entry))
+                rows[idx] = entry
+                changed += 1
+        if changed:
+            # Names stay the same, so the rows are still sorted
+            self._reindex(list_name)
+            self._dirty.add(list_name)
+        return changed
+
+    def flush(self):
+        """
+
+        Hand all changed lists to the backend to be written
+
+        Returns
+        -------
+        Number of lists that were written
+
+        """
+        if not self._dirty:
+            return 0
+        changed = {list_name: self._rows[list_name] for list_name in self._dirty}
+        written = self.backend.flush(changed, self._journal)
+        self._journal = []
+        self._dirty.clear()
+        return written
+
+
+STORE = ListStore()
+
+
+def flush_lists():
+    """
+
+    Write all changed lists to disk
+
+    Returns
+    -------
+    Number of lists that were written
+
+    """
+    return STORE.flush()
+
+
+def export_lists():
+    """
+
+    Export all lists from the SQLite database back into their CSV files
+
+    Returns
+    -------
+    `True` if lists were exported, `False` if the lists aren't kept in SQLite.
+
+    """
+    if not isinstance(STORE.backend, SqliteBackend):
+        return False
+    flush_lists()
+    for list_name in (Lists.ALLOWLIST, Lists.GREYLIST, Lists.BLOCKLIST):
+        STORE.backend.export(list_name, list_name.path)
+    return True
+
 
 def add_to_list(list_name, artist):
     """
 
-    Add artist to list file
+    Add artist to list
 
     Parameters
     ----------
@@ -52,22 +506,21 @@ def add_to_list(list_name, artist):
     """
     if list_name.value == "delete":
         return True
-    with open(list_name.value, "a") as this_list:
-        # Don't even vomit wrong ids in my clean list
-        if isinstance(artist,list):
-            if len(artist) == 2:
-                if re.search("^[0-9A-Za-z]{22}$", artist[1]):
-                    this_list.write(';'.join(artist) + '\n')
-                else:
-                    print("invalid ID")
-            elif len(artist) == 1:
-                # NOTE We could also add the id here
-                # But as we get this data from Spotify, it must have an id
-                this_list.write(artist[0] + '\n')
+    # Don't even vomit wrong ids in my clean list
+    if isinstance(artist,list):
+        if len(artist) == 2:
+            if re.search("^[0-9A-Za-z]{22}$", artist[1]):
+                STORE.add(list_name, artist)
             else:
-                raise ValueError("Should be [artistname, id] or [artist]")
-            # NOTE What if it is a string?
-            return True
+                print("invalid ID")
+        elif len(artist) == 1:
+            # NOTE We could also add the id here
+            # But as we get this data from Spotify, it must have an id
+            STORE.add(list_name, artist)
+        else:
+            raise ValueError("Should be [artistname, id] or [artist]")
+        # NOTE What if it is a string?
+        return True
     return False
 
 
@@ -88,8 +541,7 @@ def get_length_of_list(list_name):
     >>> get_length_of_list(Lists.ALLOWLIST)
     42
     """
-    with open(list_name.value) as this_list:
-        return sum(1 for line in this_list)
+    return len(STORE.rows(list_name))
 
 
 def get_list(list_name):
@@ -110,31 +562,20 @@ def get_list(list_name):
     >>> get_list(Lists.ALLOWLIST)
     ['ABBA','0LcJLqbBmaGUft1e9Mm8HV'], [.,.], ...]
     """
-    with open(list_name.value, 'r') as this_list:
-        csv_reader = csv.reader(this_list, delimiter=';')
-        all_artists = list(csv_reader)
-        return all_artists, len(all_artists)
+    all_artists = STORE.rows(list_name)
+    return all_artists, len(all_artists)
 
 def sort_list(list_name):
     """
 
     Sort a list.
+    Lists are kept sorted in memory, this just makes sure it is loaded.
 
     Parameters
     ----------
     list_name : Lists Enum
     """
-    with open(list_name.value, 'r') as this_list:
-        # Read list from file
-        sorted_list = this_list.readlines()
-        # Strip of newlines, split by ';'
-        sorted_list = list(map(lambda x: x.rstrip().split(';'), sorted_list))
-        # Sort by first attribute alone
-        sorted_list = sorted(sorted_list, key=lambda x: x[0].casefold())
-        # Join each entry again, add newline again
-        sorted_list = list(map(lambda y: y+'\n',[';'.join(x) for x in sorted_list]))
-    with open(list_name.value, 'w') as this_list:
-        this_list.writelines(sorted_list)
+    STORE.rows(list_name)
 
 def sort_all_lists(dialog):
     """
@@ -160,42 +601,10 @@ def sort_all_lists(dialog):
     dialog.gauge_stop()
 
 
-def bisect_left(rows, artist, low=0, high=None):
-    """
-
-    Binary search on rows to find, where artist should be.
-
-    Parameters
-    ----------
-    rows : List
-    artist : List [str(,str)]
-    low : int
-    high : int
-
-    Returns
-    -------
-    Return possible entry position.
-
-    Examples
-    --------
-    >>> bisect_left([['ABBA','0LcJLqbBmaGUft1e9Mm8HV'], [.,.], ...],
-                    ['PSY', '2dd5mrQZvg6SmahdgVKDzh'])
-    42
-    """
-    if high is None:
-        high = len(rows)
-    while low < high:
-        mid = (low + high) // 2
-        if rows[mid][0].lower() < artist[0].lower():
-            low = mid + 1
-        else:
-            high = mid
-    return low
-
 def search_list(list_name, artist):
     """
 
-    Search through list using binary search.
+    Search through list using the id and name index.
 
     Parameters
     ----------
@@ -208,20 +617,19 @@ def search_list(list_name, artist):
 
     Examples
     --------
-    >>> check_if_on_list(Lists.BLOCKLIST, ['PSY', '2dd5mrQZvg6SmahdgVKDzh'])
+    >>> search_list(Lists.BLOCKLIST, ['PSY', '2dd5mrQZvg6SmahdgVKDzh'])
     ['PSY', '2dd5mrQZvg6SmahdgVKDzh']
-    >>> check_if_on_list(Lists.BLOCKLIST, 'PSY')
+    >>> search_list(Lists.BLOCKLIST, 'PSY')
     ['PSY', '2dd5mrQZvg6SmahdgVKDzh']
     >>> search_list(Lists.ALLOWLIST, ['PSY', '2dd5mrQZvg6SmahdgVKDzh'])
     False
     """
-    whole_list, _ = get_list(list_name)
-    idx = bisect_left(whole_list, artist)
-    if len(whole_list) <= idx or \
-       (isinstance(artist, list) and whole_list[idx][0].lower() != artist[0].lower()) or \
-       (isinstance(artist, str) and whole_list[idx][0].lower() != artist.lower()):
+    if not artist:
+        return False
+    entry = STORE.find(list_name, artist)
+    if entry is None:
         return False
-    return whole_list[idx]
+    return entry
 
 def check_if_on_list(list_name, artist):
     """
@@ -295,21 +703,33 @@ def add_missing_id(list_name, artist, entry):
         # ID is wrong! You almost got me in the first half
         entry = [entry[0]]
     if len(entry) == 1: # We know it's there but without an id
-        read_csv = []
-        with open(list_name.value, 'r') as this_list:
-            read_csv = list(csv.reader(this_list, delimiter=';'))
-        with open(list_name.value, 'w') as this_list:
-            write_csv = csv.writer(this_list, delimiter=';')
-            fixed = False
-            for line in read_csv:
-                if not fixed:
-                    if line[0] == artist[0]:
-                        line = artist
-                        fixed = True
-                write_csv.writerow(line)
-        return fixed
+        if not (len(artist) == 2 and artist[1]):
+            return False
+        return STORE.replace(list_name, lambda line: line[0] == entry[0], artist)
     return False # Something went wrong
 
+def add_missing_ids(list_name, artists):
+    """
+
+    Add ids to all entries of list that don't have one yet, at once
+
+    Parameters
+    ----------
+    list_name : Lists Enum
+    artists : List of [str,str]
+
+    Returns
+    -------
+    Number of entries that got an id
+
+    Examples
+    --------
+    >>> add_missing_ids(Lists.ALLOWLIST, [['PSY', '2dd5mrQZvg6SmahdgVKDzh'],
+                                          ['ABBA', '0LcJLqbBmaGUft1e9Mm8HV']])
+    2
+    """
+    return STORE.add_ids(list_name, {artist[0]: artist[1] for artist in artists})
+
 def delete_dupes_from_list(list_name):
     """
 
@@ -325,22 +745,15 @@ def delete_dupes_from_list(list_name):
 
     """
     # NOTE What if the same entry exists with and without an id?
-    read_csv = []
-    deleted_dupes = 0
-    with open(list_name.value, 'r') as read_list:
-        read_csv = list(csv.reader(read_list, delimiter=';'))
-    with open(list_name.value, 'w') as write_list:
-        write_csv = csv.writer(write_list, delimiter=';')
-        seen = set()
-        for line in read_csv:
-            if line in seen:
-                deleted_dupes += 1
-            else:
-                seen.add(line)
-                write_csv.writerow(line)
-    return deleted_dupes
+    seen = set()
+    def is_dupe(line):
+        if tuple(line) in seen:
+            return True
+        seen.add(tuple(line))
+        return False
+    return STORE.remove(list_name, is_dupe)
 
-def compare_artists(line_in_csv, artist, write_csv):
+def compare_artists(line_in_csv, artist):
     """
 
     Compare artist to line in csv file
@@ -348,51 +761,38 @@ def compare_artists(line_in_csv, artist, write_csv):
     Parameters
     ----------
     line_in_csv : List [str(, str)]
-    artist : List [str(,str)] or str
-    write_csv : _csv.writer object
+    artist : Tuple (str, str or None)
 
     Returns
     -------
-    `True` if entry was deleted, `False` if not, else `IndexError`.
+    `True` if entry matches, `False` if not, else `IndexError`.
 
     Examples
     --------
-    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'], ['PSY', '2dd5mrQZvg6SmahdgVKDzh'], csv)
-    True
-    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'], ['PSY'], csv)
+    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'], ('PSY', '2dd5mrQZvg6SmahdgVKDzh'))
     True
-    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'], 'PSY', csv)
+    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'], ('PSY', None))
     True
-    >>> compare_artists(['PSY'], ['PSY'], csv)
+    >>> compare_artists(['PSY'], ('PSY', None))
     True
-    >>> compare_artists(['PSY'], ['PSY', '2dd5mrQZvg6SmahdgVKDzh'], csv)
+    >>> compare_artists(['PSY'], ('PSY', '2dd5mrQZvg6SmahdgVKDzh'))
     True
-    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'], '2dd5mrQZvg6SmahdgVKDzh', csv)
+    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'], ('2dd5mrQZvg6SmahdgVKDzh', None))
     False
-    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh'],
-                        ['PSY', '2dd5mrQZvg6SmahdgVKDzh', 1], csv)
+    >>> compare_artists(['PSY', '2dd5mrQZvg6SmahdgVKDzh', 1], ('PSY', '2dd5mrQZvg6SmahdgVKDzh'))
     IndexError("Expected 2 or 1 arguments [name(,id)]")
     """
     len_line = len(line_in_csv)
     # If there is not id in search
     if artist[1] is None or len_line == 1:
         # If the name matches
-        if artist[0] == line_in_csv[0]:
-            return True
-        write_csv.writerow(line_in_csv)
-        return False
+        return artist[0] == line_in_csv[0]
     # If there is an id
     # If the entry in the list also has an id
     if len_line == 2:
         # If the id matches
-        if artist[1] == line_in_csv[1]:
-            return True
-        write_csv.writerow(line_in_csv)
-        return False
+        return artist[1] == line_in_csv[1]
     raise IndexError("Expected 2 or 1 arguments [name(,id)]")
-    # NOTE Gotta check the runtime here
-    # Could be improved by re-write in a new file and move
-    # Function call overhead is there, but negligible
 
 
 def delete_from_list(list_name, artist):
@@ -423,7 +823,7 @@ def delete_from_list(list_name, artist):
 
     # Parameter checking
     # NOTE Should probably be it's own method
-    if not isinstance(list_name, Lists):
+    if not isinstance(list_name, Lists) or list_name == Lists.DELETE:
         return False
     if isinstance(artist, list):
         if len(artist) == 2:
@@ -442,15 +842,8 @@ def delete_from_list(list_name, artist):
         else:
             return False
 
-    read_csv = []
-    deleted_value = False
-    with open(list_name.value, 'r') as this_list:
-        read_csv = list(csv.reader(this_list, delimiter=';'))
-    with open(list_name.value, 'w') as this_list:
-        write_csv = csv.writer(this_list, delimiter=';')
-        for line in read_csv:
-            compare_artists(line, (artist_name, artist_id), write_csv)
-    return deleted_value
+    return STORE.remove(list_name,
+                        lambda line: compare_artists(line, (artist_name, artist_id))) > 0
 
 def move_artist_between_lists(list_from, list_to, artist):
     """
@@ -489,42 +882,59 @@ def move_artist_between_lists(list_from, list_to, artist):
     if not isinstance(artist, list):
         if not isinstance(artist, str):
             return False
+        artist = [artist]
     else:
         # Artist is list
-        if 0 >= len(artist) > 2:
+        if not 0 < len(artist) <= 2:
             return False
 
     if add_to_list(list_to, artist):
-        if list_to != Lists.DELETE:
-            sort_list(list_to)
         return delete_from_list(list_from, artist)
     print('not added')
     return False
 
 
-def remove_blocklisted(artist_dict, artist_set):
+class Blocklist:
     """
 
-    Remove blocklisted artists
+    Blocklisted artist ids as set, loaded once per run
 
-    Parameters
-    ----------
-    artist_dict : dict
-    artist_set : set
+    Entries without an id are matched by casefolded name instead. When that
+    happens, the id gets added to the entry, so next time the id is enough.
 
-    Returns
-    -------
-    Trimmed artists_dict, artists_set and the number of removed artists
-
-    """
-    artists_to_remove =[]
-    for artist in artist_dict:
-        #entry = search_list(Lists.BLOCKLIST, artist)
-        entry = check_if_on_list(Lists.BLOCKLIST, [artist, artist_dict[artist]])
-        if entry: # entry found
-            #    # No id
-            artists_to_remove.append(artist)
-    for artist in artists_to_remove:
-        artist_set.discard(artist_dict[artist])
-        del artist_dict[artist]
-    return artist_dict, artist_set, len(artists_to_remove)
+    Examples
+    --------
+    >>> blocklist = Blocklist()
+    >>> blocklist.filter({'2dd5mrQZvg6SmahdgVKDzh': 'PSY',
+                          '0LcJLqbBmaGUft1e9Mm8HV': 'ABBA'})
+    {'0LcJLqbBmaGUft1e9Mm8HV': 'ABBA'}
+    """
+
+    def __init__(self):
+        self.ids = STORE.ids(Lists.BLOCKLIST)
+        self._names = {row[0].casefold(): row for row in STORE.rows(Lists.BLOCKLIST)
+                       if len(row) == 1}
+
+    def filter(self, artists):
+        """
+
+        Drop all blocklisted artists
+
+        Parameters
+        ----------
+        artists : dict of artist id to artist name
+
+        Returns
+        -------
+        dict of the artists that aren't blocklisted
+
+        """
+        allowed_ids = artists.keys() - self.ids
+        if self._names:
+            for artist_id in list(allowed_ids):
+                entry = self._names.get(artists[artist_id].casefold())
+                if entry:
+                    add_missing_id(Lists.BLOCKLIST, [artists[artist_id], artist_id], entry)
+                    self.ids.add(artist_id)
+                    allowed_ids.discard(artist_id)
+        return {artist_id: artists[artist_id] for artist_id in allowed_ids}
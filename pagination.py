@@ -0,0 +1,111 @@
+"""
+
+Page through Spotify endpoints
+
+Subtasks:
+    - Always ask for the biggest page an endpoint allows
+    - Fetch the remaining pages of offset based endpoints in parallel
+    - Follow cursor based endpoints page by page, as generator
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import concurrent.futures
+import threading
+import config_io as conf
+
+# Biggest page size each endpoint allows
+MAX_LIMITS = {
+    'artist_albums': 50,
+    'album_tracks': 50,
+    'current_user_playlists': 50,
+    'playlist_tracks': 100,
+    'playlist_items': 100,
+    'current_user_followed_artists': 50,
+    }
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def get_executor():
+    """
+
+    Thread pool for fetching pages
+    Kept apart from other pools, so a worker waiting for its pages can't block them.
+
+    """
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=conf.get_workers())
+        return _EXECUTOR
+
+def iter_pages(spot_conn, endpoint, *args, first_page=None, parallel=True, **kwargs):
+    """
+
+    Get all pages of an offset based endpoint, in order
+
+    The first page tells how many items there are, all other pages are then
+    requested at once. With `parallel=False`, pages are requested one by one
+    through `next`, so stopping early saves requests.
+
+    Parameters
+    ----------
+    spot_conn : spotipy.Spotify (or something that wraps it)
+    endpoint : str, name of the spotipy method
+    first_page : dict, page that we already have (e.g. tracks embedded in an album)
+    parallel : bool
+
+    Examples
+    --------
+    >>> [len(page['items']) for page in iter_pages(spot_conn, 'album_tracks', album_id)]
+    [50, 50, 12]
+    """
+    fetch = getattr(spot_conn, endpoint)
+    limit = MAX_LIMITS[endpoint]
+    page = first_page
+    if page is None:
+        page = fetch(*args, limit=limit, offset=0, **kwargs)
+    yield page
+    if not page['next']:
+        return
+    if not parallel:
+        while page['next']:
+            page = spot_conn.next(page)
+            yield page
+        return
+    offsets = range(page['offset'] + page['limit'], page['total'], limit)
+    futures = [get_executor().submit(fetch, *args, limit=limit, offset=offset, **kwargs)
+               for offset in offsets]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def iter_items(spot_conn, endpoint, *args, **kwargs):
+    """
+
+    Get all items of an offset based endpoint, in order
+
+    """
+    for page in iter_pages(spot_conn, endpoint, *args, **kwargs):
+        yield from page['items']
+
+def iter_cursor_pages(spot_conn, endpoint, key, **kwargs):
+    """
+
+    Get all pages of a cursor based endpoint, page by page
+
+    Parameters
+    ----------
+    key : str, key of the paging object in the response (e.g. 'artists')
+
+    """
+    page = getattr(spot_conn, endpoint)(limit=MAX_LIMITS[endpoint], **kwargs)[key]
+    yield page
+    while page['next']:
+        page = spot_conn.next(page)[key]
+        yield page
@@ -10,22 +10,39 @@ Get and manage new songs and artists from Spotify
 __license__ = "EUPL"
 __docformat__ = 'reStructuredText'
 
-import difflib
+import argparse
+import atexit
+import concurrent.futures
+import functools
+import json
 import subprocess
 import math
 import os.path
+import queue
 import sys
+import threading
+import time
+from datetime import datetime
 from enum import Enum
-import pygame
-from dialog import Dialog
-import spotipy
-import spotipy.util as util
 import file_interaction as fi
 import config_io as conf
-from colorama import Fore, Back, Style
+from buzzwords import get_buzz_filter
+from dedupe import Deduper, IsrcDeduper, release_rank
+from delivered import get_delivered
+from pagination import iter_cursor_pages, iter_items, iter_pages
+from response_cache import get_cache
+from watermarks import get_watermarks
 
 # Currently set to 28 Aug 2020
 
+# Exit codes of batch mode
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_TOKEN = 3
+# What happens to new artists: I(gnore), W (allowlist), B(locklist) or A(dd songs)
+NEW_ARTIST_POLICIES = ('I', 'W', 'B', 'A')
+
 
 class States(Enum):
     """
@@ -49,10 +66,63 @@ class States(Enum):
     # NOTE Using int would improve performance, but result in worse legibility
 
 
-DIALOG = Dialog(dialog="dialog")
+class HeadlessDialog:
+    """
+
+    Stands in for dialog.Dialog in batch mode: shows nothing and never asks
+
+    """
+    OK = "ok"
+
+    def maxsize(self):
+        """ Pretend to be a plain terminal """
+        return 24, 80
+
+    def gauge_start(self, *args, **kwargs):
+        """ Nothing to show """
+
+    def gauge_update(self, *args, **kwargs):
+        """ Nothing to show """
+
+    def gauge_stop(self, *args, **kwargs):
+        """ Nothing to show """
+
+    def msgbox(self, *args, **kwargs):
+        """ Nothing to show """
+
+    def __getattr__(self, name):
+        raise RuntimeError("Batch mode can't show dialog '%s', it needs a decision" % (name))
+
+
+# Created in main, batch mode uses a HeadlessDialog
+DIALOG = None
 ARTISTS_SET = set()
 ARTISTS_DICT = {}
+# How many artists the source of the run has (tracks for playlists), None while unknown
+SOURCE_TOTAL = None
 ALL_SONGS = set()
+ALBUMS_PER_REQUEST = 20
+TRACKS_PER_REQUEST = 50
+SONGS_LOCK = threading.Lock()
+DEDUPER = Deduper()
+ISRC_DEDUPER = IsrcDeduper()
+# Album types of the new releases of every artist in this run
+RELEASE_TYPES = {}
+RELEASE_TYPES_LOCK = threading.Lock()
+NEW_ARTISTS = []
+# Everything we read from playlist items, plus what's needed for paging
+PLAYLIST_FIELDS = 'items(is_local,track(artists(id,name))),next,total,offset,limit'
+# Spotify takes at most 100 tracks per request
+TRACKS_PER_WRITE = 100
+# Songs waiting for the playlist writer, at most this many requests' worth
+WRITE_QUEUE_CHUNKS = 10
+# Write a chunk that isn't full yet, if no songs came in for this many seconds
+WRITE_AFTER = 2.0
+# Artists handed to the workers but not done yet, per worker
+ARTISTS_IN_FLIGHT = 4
+# Writes the songs of the current run into the destination playlist
+WRITER = None
+RELEASE_FILTER = None
 LIST_DICT = {
     fi.Lists.ALLOWLIST.value:  fi.Lists.ALLOWLIST,
     fi.Lists.GREYLIST.value:  fi.Lists.GREYLIST,
@@ -60,13 +130,34 @@ LIST_DICT = {
     fi.Lists.DELETE.value:  fi.Lists.DELETE
     }
 
+def connect(interactive=True):
+    """
+
+    Connect to Spotify, `None` if there is no token
+
+    The client lives as long as the process, so every run after the first
+    reuses its connections and token.
+
+    """
+    # Only imported once we actually talk to Spotify, spotipy takes a while
+    import spotify_client
+    return spotify_client.get_client().connect(interactive)
+
 def main():
     """
 
     One function to start them all
 
     """
+    global DIALOG
+    from dialog import Dialog
+    DIALOG = Dialog(dialog="dialog")
+    # Changed lists also get written if we leave in the middle of a run
+    atexit.register(fi.flush_lists)
     if os.path.isfile('mach_die_robbe.mp3'):
+        # pygame is only needed for this, so only pay for it (and its banner) here
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        import pygame
         pygame.mixer.init()
         pygame.mixer.music.load("mach_die_robbe.mp3")
         pygame.mixer.music.play(-1)
@@ -78,46 +169,47 @@ def main():
                 clear_screen()
                 sys.exit()
 
-        scope = 'playlist-read-collaborative \
-                 playlist-read-private \
-                 playlist-modify-private \
-                 playlist-modify-public \
-                 user-follow-read'
-        token = util.prompt_for_user_token(conf.get_key('Auth', 'username'), scope,
-                                           client_id=conf.get_key('Auth', 'client_id'),
-                                           client_secret=conf.get_key('Auth', 'client_secret'),
-                                           redirect_uri='http://localhost:8888/callback/')
-        if token:
-
-            spot_conn = spotipy.Spotify(auth=token)
-            #spot_conn.trace = False
+        spot_conn = connect()
+        if spot_conn:
 
-            fi.sort_all_lists(DIALOG)
+            dest_playlist = choose_dest_playlist(spot_conn)
+            if not dest_playlist:
+                state = States.START
+                clear_screen()
+                continue
 
-            get_songs(spot_conn, state)
+            done, _ = get_songs(spot_conn, state, dest_playlist=dest_playlist)
 
-            if not add_songs_to_playlist(spot_conn):
+            if not done:
+                get_watermarks().discard()
+                # Songs that made it are in the playlist, but maybe not all of an album
+                get_delivered().commit(albums=False)
                 size = get_window_size((5, 5), (10, 28))
                 DIALOG.msgbox(text="\n\nSomething didn't go right, "+ \
                                    "while adding songs to your playlist.",
                               height=size[0], width=size[1])
             else:
                 conf.write_time()
+                get_watermarks().commit()
+                get_delivered().commit()
                 text="""
                 ██████╗░░█████╗░███╗░░██╗███████╗██╗
                 ██╔══██╗██╔══██╗████╗░██║██╔════╝██║
                 ██║░░██║██║░░██║██╔██╗██║█████╗░░██║
                 ██║░░██║██║░░██║██║╚████║██╔══╝░░╚═╝
                 ██████╔╝╚█████╔╝██║░╚███║███████╗██╗
-                ╚═════╝░░╚════╝░╚═╝░░╚══╝╚══════╝╚═╝"""
+                ╚═════╝░░╚════╝░╚═╝░░╚══╝╚══════╝╚═╝
+
+                %d songs added""" % (WRITER.written)
 
-                size = get_window_size((12, 0), (41, 0))
+                size = get_window_size((14, 0), (41, 0))
                 DIALOG.msgbox(text, height=size[0], width=size[1])
 
             state = States.START
             clear_screen()
 
-            fi.sort_all_lists(DIALOG)
+            # Write back everything this run changed on the lists, only once
+            fi.flush_lists()
         else:
             print("Can't get token for", conf.get_key('Auth', 'username'))
 
@@ -188,7 +280,7 @@ def rel_menu():
     """
     conf_set, _ = conf.get_credentials()
     if conf_set:
-        if not conf.get_key('Other', 'source'):
+        if not conf.CONFIG.source():
             return States.SOURCE
         return States.NEW_RELEASES
     return States.CONF
@@ -377,6 +469,7 @@ def list_and_push_artists(from_list):
         to_list = LIST_DICT[to_list]
         for i in tags:
             fi.move_artist_between_lists(from_list, to_list, artists[int(i)])
+        fi.flush_lists()
         return True
     return False
 
@@ -417,7 +510,9 @@ def search_and_push_artist(from_list):
                                     height=size[0], width=size[1], colors=True)
         if code == DIALOG.OK:
             to_list = LIST_DICT[to_list]
-            if fi.move_artist_between_lists(from_list, to_list, entry):
+            moved = fi.move_artist_between_lists(from_list, to_list, entry)
+            fi.flush_lists()
+            if moved:
                 return True
     return False
 
@@ -539,17 +634,61 @@ def configure_prog():
         valid, error_msg = conf.check_credentials(fields)
 
     if code == DIALOG.OK:
-        conf.set_key('Auth', 'username', fields[0])
-        conf.set_key('Auth', 'client_id', fields[1])
-        conf.set_key('Auth', 'client_secret', fields[2])
-        conf.set_key('Other', 'country', fields[3])
-        conf.set_key('Lists', 'allowlist', fields[4])
-        conf.set_key('Lists', 'greylist', fields[5])
-        conf.set_key('Lists', 'blocklist', fields[6])
+        with conf.batch():
+            conf.set_key('Auth', 'username', fields[0])
+            conf.set_key('Auth', 'client_id', fields[1])
+            conf.set_key('Auth', 'client_secret', fields[2])
+            conf.set_key('Other', 'country', fields[3])
+            conf.set_key('Lists', 'allowlist', fields[4])
+            conf.set_key('Lists', 'greylist', fields[5])
+            conf.set_key('Lists', 'blocklist', fields[6])
 
     return States.START
 
 
+def search_artist_id(spot_conn, name):
+    """
+
+    Get artist id of name, remembered in the response cache
+
+    Names without a match are remembered too, for artist_search_miss_ttl
+    hours, so they don't cost a search every run.
+
+    """
+    cache = get_cache()
+    key = cache.make_key('artist_search', name)
+    artist_id = cache.get(key)
+    if artist_id is not None:
+        return artist_id
+    miss_key = cache.make_key('artist_search_miss', name)
+    if cache.get(miss_key, conf.get_search_miss_ttl()) is not None:
+        return None
+    artist_id = check_and_get_artist_id(spot_conn, name)
+    if artist_id is None:
+        cache.put(miss_key, True)
+    else:
+        cache.put(key, artist_id)
+    return artist_id
+
+
+def resolve_artist_ids(spot_conn, names):
+    """
+
+    Search artist ids of names at the same time
+
+    Yields
+    ------
+    (name, id) as the searches are done, id is `None` if there was no match
+
+    """
+    if not names:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=conf.get_workers()) as executor:
+        futures = {executor.submit(search_artist_id, spot_conn, name): name for name in names}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+
 def check_and_get_artist_id(spot_conn, name):
     """
 
@@ -578,114 +717,536 @@ def check_and_get_artist_id(spot_conn, name):
 def buzz_filter(string):
     """
     Filter out strings containing buzz words, except for the ones having anti_buzz words
+    The rules are in the file configured in [Other] buzzwords.
     """
-    buzzwords = ['LIVE', '- Live', '(Live']
-    buzzwords_lowercase = ['(live', ' - live', ' live version',
-                           ' live from', ' live in', ' live at', 'instrumental',
-                           'interlude', 'acoustic']
-    anti_buzzwords = ['RAC']
-    anti_buzzwords_lowercase = ['rac']
-
-    # Contains any buzzword from the list
-    has_buzzwords = any(buzz in string for buzz in buzzwords)
+    return get_buzz_filter().keep(string)
 
-    # Contains any anti buzzword from the list that would allow the use of a buzzword
-    has_anti_buzzwords = any(anti_buzz in string for anti_buzz in anti_buzzwords)
+def fetch_albums_tracks(spot_conn, album_ids):
+    """
 
-    # Same for case-insensitive buzzwords.
-    has_lowercase_buzzwords = any(buzz in string.lower() for buzz in buzzwords_lowercase)
-    has_lowercase_anti_buzzwords = any(anti_buzz in string.lower() \
-            for anti_buzz in anti_buzzwords_lowercase)
+    Get track items of up to 20 album IDs from Spotify, with one request
+    Only albums with more than 50 tracks need more requests for their other pages.
 
-    return (not has_buzzwords or has_anti_buzzwords ) and \
-           (not has_lowercase_buzzwords or has_lowercase_anti_buzzwords)
+    """
+    albums_tracks = {}
+    for album in spot_conn.albums(album_ids)['albums']:
+        if album is None:
+            continue
+        albums_tracks[album['id']] = list(iter_items(spot_conn, 'album_tracks', album['id'],
+                                                     first_page=album['tracks']))
+    return albums_tracks
 
-def get_album_tracks(spot_conn, album, track_names, track_uris):
+def get_albums_tracks(spot_conn, album_ids):
     """
 
-    Get all tracks from album ID
+    Get track items of up to 20 album IDs
+    Track lists don't change, so they're cached forever.
 
     """
-    tracks = []
-    num_tracks = 0
-    track_page = spot_conn.album_tracks(album['id'], limit=10)
+    cache = get_cache()
+    albums_tracks = {}
+    missing = []
+    for album_id in album_ids:
+        tracks = cache.get(cache.make_key('album_tracks', album_id))
+        if tracks is None:
+            missing.append(album_id)
+        else:
+            albums_tracks[album_id] = tracks
+    if missing:
+        for album_id, tracks in fetch_albums_tracks(spot_conn, missing).items():
+            cache.put(cache.make_key('album_tracks', album_id), tracks)
+            albums_tracks[album_id] = tracks
+    return albums_tracks
 
-    tracks.extend(track_page['items'])
+def add_albums_tracks(spot_conn, album_ids, writer=None):
+    """
 
-    while track_page['next']:
-        track_page = spot_conn.next(track_page)
-        tracks.extend(track_page['items'])
-    for track in tracks:
-        track_name = track['name']
-        if buzz_filter(track_name):
-            track_names.append(track_name)
-            track_uris.append(track['uri'])
-            ALL_SONGS.add(track['uri'])
-            num_tracks += 1
+    Add the tracks of up to 20 album IDs to the songs of this run, and to writer
+
+    """
+    tracks = []
+    albums_tracks = get_albums_tracks(spot_conn, album_ids)
+    for album_id in album_ids:
+        album_tracks = albums_tracks.get(album_id, [])
+        kept = get_buzz_filter().keep_all([track['name'] for track in album_tracks])
+        tracks.extend(track for track, keep in zip(album_tracks, kept) if keep)
+    prefer = conf.get_isrc_dedupe()
+    if prefer is None:
+        track_names = [track['name'] for track in tracks]
+        track_uris = [track['uri'] for track in tracks]
+        track_artists = [{artist['id'] for artist in track['artists']} for track in tracks]
+        delete_duplicate_songs(track_names, track_uris, track_artists)
+    else:
+        track_uris = [track['uri'] for track in
+                      delete_duplicate_recordings(spot_conn, tracks, prefer)]
+    num_tracks = len(track_uris)
+    add_songs(track_uris, writer)
+    if writer is not None:
+        # Once the run went through, all of their songs are in a playlist
+        get_delivered().add_albums(album_ids)
     return num_tracks
     # NOTE How to filter remixes, if the remixer isn't the artist?
 
 def get_artist_albums(spot_conn, artist_id):
     """
 
-    Get all albums from artist ID
+    Get albums from artist ID, cached for artist_albums_ttl hours
+    Known artists only get the albums newer than their watermark, unless
+    the cutoff of this run is earlier than the one of their watermark.
+
+    """
+    watermark = get_watermarks().get(artist_id)
+    if watermark is None or not get_watermarks().covers(watermark, RELEASE_FILTER.cutoff):
+        return get_cache().fetch(conf.get_albums_ttl(),
+                                 functools.partial(fetch_artist_albums, spot_conn),
+                                 'artist_albums', artist_id)
+    return get_cache().fetch(conf.get_albums_ttl(),
+                             functools.partial(fetch_new_artist_albums, spot_conn, watermark),
+                             'artist_albums_since', artist_id,
+                             key_args=(artist_id, watermark['id']))
+
+def fetch_new_artist_albums(spot_conn, watermark, artist_id):
+    """
+
+    Get albums from artist ID, that are newer than the watermark
+
+    Spotify lists albums first, then singles, both newest first. Paging
+    through that one listing stops at the first single already seen, so
+    artists with up to 50 releases only cost one request. If the albums
+    reached the watermark and there are still pages left, the rest of them
+    is known, and the singles are paged through on their own instead.
 
     """
     albums = []
-    album_page = spot_conn.artist_albums(artist_id, album_type='album,single', limit=10)
-    albums.extend(album_page['items'])
-    while album_page['next']:
-        album_page = spot_conn.next(album_page)
-        albums.extend(album_page['items'])
+    albums_seen = False
+    for page in iter_pages(spot_conn, 'artist_albums', artist_id, album_type='album,single',
+                           parallel=False):
+        group = None
+        for album in page['items']:
+            group = album.get('album_group', album['album_type'])
+            if get_watermarks().is_seen(watermark, album):
+                if group == 'single':
+                    return albums
+                albums_seen = True
+            elif group == 'single' or not albums_seen:
+                albums.append(album)
+        if albums_seen and group != 'single' and page['next']:
+            break
+    else:
+        return albums
+    for album in iter_items(spot_conn, 'artist_albums', artist_id, album_type='single',
+                            parallel=False):
+        if get_watermarks().is_seen(watermark, album):
+            break
+        albums.append(album)
     return albums
 
+def fetch_artist_albums(spot_conn, artist_id):
+    """
+
+    Get all albums from artist ID from Spotify
 
-def delete_duplicate_songs(track_names, track_uris):
     """
+    return list(iter_items(spot_conn, 'artist_albums', artist_id, album_type='album,single'))
 
-    Remove duplicate songs
 
+def delete_duplicate_songs(track_names, track_uris, track_artists):
     """
-    duplicates = 0
-    for track_first_idx in enumerate(track_names):
-        for track_second_idx in range(track_first_idx[0], len(track_uris)):
-            if track_first_idx[0] != track_second_idx:
-                seq = difflib.SequenceMatcher(a=track_names[track_first_idx[0]].lower(),
-                                              b=track_names[track_second_idx].lower())
-                if seq.ratio() > 0.9:
-                    if track_uris[track_second_idx] in ALL_SONGS:
-                        ALL_SONGS.remove(track_uris[track_second_idx])
-                        duplicates += 1
+
+    Remove duplicate songs from the lists, also against songs of other artists in this run
+
+    """
+    kept_names = []
+    kept_uris = []
+    for track_name, track_uri, artist_ids in zip(track_names, track_uris, track_artists):
+        if DEDUPER.add(track_name, artist_ids):
+            kept_names.append(track_name)
+            kept_uris.append(track_uri)
+    duplicates = len(track_uris) - len(kept_uris)
+    track_names[:] = kept_names
+    track_uris[:] = kept_uris
     return duplicates
 
 
-def check_artist_albums(spot_conn, artist_info):
+def fetch_tracks_releases(spot_conn, track_ids):
+    """
+
+    Get ISRC, release date and album type of track IDs from Spotify, 50 tracks per request
+
+    """
+    releases = {}
+    for i in range(0, len(track_ids), TRACKS_PER_REQUEST):
+        for track in spot_conn.tracks(track_ids[i:i + TRACKS_PER_REQUEST])['tracks']:
+            if track is None:
+                continue
+            releases[track['id']] = [track.get('external_ids', {}).get('isrc'),
+                                     track['album']['release_date'],
+                                     track['album']['album_type']]
+    return releases
+
+def get_tracks_releases(spot_conn, track_ids):
+    """
+
+    Get [ISRC, release date, album type] of track IDs
+    Recordings don't change, so they're cached forever.
+
+    """
+    cache = get_cache()
+    releases = {}
+    missing = []
+    for track_id in track_ids:
+        release = cache.get(cache.make_key('track_release', track_id))
+        if release is None:
+            missing.append(track_id)
+        else:
+            releases[track_id] = release
+    if missing:
+        for track_id, release in fetch_tracks_releases(spot_conn, missing).items():
+            cache.put(cache.make_key('track_release', track_id), release)
+            releases[track_id] = release
+    return releases
+
+def delete_duplicate_recordings(spot_conn, tracks, prefer):
+    """
+
+    Remove duplicate songs like delete_duplicate_songs, but let ISRCs decide
+
+    Songs whose title matches an earlier song of their artists are looked
+    up, together with that earlier song. So are all songs of artists with
+    both singles and other releases in this run, as a song of a single
+    often comes again on an album under another title. If both have an
+    ISRC, songs of different recordings are kept. Of the same recording
+    only the release preferred by prefer is kept (see dedupe.release_rank),
+    unless the other song is from an earlier batch and may be written
+    already. Without ISRC, the title decides.
+
+    Returns
+    -------
+    List of the tracks to keep
+
+    """
+    kept = []
+    matches = []
+    for track in tracks:
+        added, earlier = DEDUPER.add_or_find(track['name'],
+                                             {artist['id'] for artist in track['artists']},
+                                             track)
+        if added:
+            kept.append(track)
+        else:
+            matches.append((track, earlier))
+    rereleased = [track for track in kept if has_singles_and_albums(track['artists'])]
+    if not matches and not rereleased:
+        return kept
+    looked_up = rereleased + [song for match in matches for song in match]
+    releases = get_tracks_releases(spot_conn,
+                                   list({song['id'] for song in looked_up if song['id']}))
+    def recording(track):
+        isrc, release_date, album_type = releases.get(track['id'], (None, None, None))
+        if isrc is None:
+            return None
+        return (track['uri'], isrc.upper(), release_rank(release_date, album_type, prefer))
+
+    batch_uris = {track['uri'] for track in kept}
+    older = []
+    songs = [song for song in map(recording, rereleased) if song is not None]
+    for track, earlier in matches:
+        new, old = recording(track), recording(earlier)
+        if new is None or old is None:
+            continue
+        songs.append(new)
+        if earlier['uri'] in batch_uris:
+            songs.append(old)
+        else:
+            older.append(old)
+    # Songs of earlier batches stay, their recordings are taken
+    ISRC_DEDUPER.select(older)
+    chosen = set(ISRC_DEDUPER.select(songs))
+    compared = {uri for uri, _, _ in songs}
+    return [track for track in kept if track['uri'] not in compared or track['uri'] in chosen] + \
+           [track for track, _ in matches if track['uri'] in chosen]
+
+
+def has_singles_and_albums(artists):
+    """
+
+    Check if one of artists has singles and albums or compilations in this run
+
+    """
+    with RELEASE_TYPES_LOCK:
+        for artist in artists:
+            album_types = RELEASE_TYPES.get(artist['id'], set())
+            if 'single' in album_types and len(album_types) > 1:
+                return True
+    return False
+
+
+def add_songs(track_uris, writer=None):
+    """
+
+    Add songs to the songs of this run, safe to call from worker threads
+
+    Songs that are new to this run go on to the playlist writer of the run
+    right away, unless an earlier run already delivered them.
+
+    """
+    delivered = get_delivered()
+    track_uris = [track_uri for track_uri in track_uris if not delivered.has_track(track_uri)]
+    with SONGS_LOCK:
+        new_uris = [track_uri for track_uri in track_uris if track_uri not in ALL_SONGS]
+        ALL_SONGS.update(new_uris)
+    if writer is not None and new_uris:
+        writer.put(new_uris)
+
+
+def get_new_albums(spot_conn, artist_info):
     """
 
-    Go through all album tracks of artists
+    Get all albums of artist, that were released since the last check
 
     """
-    num_tracks = 0
-    track_names = []
-    track_uris = []
     albums = get_artist_albums(spot_conn, artist_info[1])
-    #i = 0
-    #DIALOG.gauge_start(text="Gathering songs by %s ..." % (artist_info[0]), percent=0)
-    #total_albums = len(albums)
+    # Albums after until weren't looked at, the next run needs to get them again
+    get_watermarks().update(artist_info[1], RELEASE_FILTER.until_filter(albums),
+                            RELEASE_FILTER.cutoff)
+    new_albums = select_new_albums(albums)
+    with RELEASE_TYPES_LOCK:
+        RELEASE_TYPES.setdefault(artist_info[1], set()).update(
+            album['album_type'] for album in new_albums)
+    return new_albums
 
+def select_new_albums(albums):
+    """
+
+    Get albums released since the last check, without duplicates and compilations
+
+    """
+    new_albums = []
     unique = set()  # skip duplicate albums
-    for album in albums:
-        #DIALOG.gauge_update(math.floor((i/total_albums)*100))
+    for album in RELEASE_FILTER.filter(albums):
         album_name = album['name']
         if album_name not in unique and album['album_type'] != 'compliation':
-            if conf.get_release_date(album) > conf.read_time():
-                num_tracks += get_album_tracks(spot_conn, album, track_names, track_uris)
-
+            new_albums.append(album)
             unique.add(album_name)
-        #i += 1
-    #DIALOG.gauge_stop()
-    num_tracks -= delete_duplicate_songs(track_names, track_uris)
-    return num_tracks
+    return new_albums
+
+
+def prefetch_artist_songs(spot_conn, artist_id):
+    """
+
+    Fetch new albums of artist and their tracks into the cache, without adding songs
+    Done for new artists while the user decides, so adding them costs no extra wait.
+
+    """
+    delivered = get_delivered()
+    albums = select_new_albums(get_artist_albums(spot_conn, artist_id))
+    album_ids = [album['id'] for album in albums if not delivered.has_album(album['id'])]
+    for i in range(0, len(album_ids), ALBUMS_PER_REQUEST):
+        get_albums_tracks(spot_conn, album_ids[i:i + ALBUMS_PER_REQUEST])
+
+
+class AlbumBatcher:
+    """
+
+    Collect new albums of many artists, to fetch their tracks 20 albums at a time
+
+    Batches are handed to the executor as soon as they are full, `flush`
+    hands over the rest. Their songs go to writer, if there is one.
+
+    """
+
+    def __init__(self, spot_conn, executor, writer=None):
+        self._spot_conn = spot_conn
+        self._executor = executor
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._album_ids = []
+        self.futures = []
+
+    def _submit(self, album_ids):
+        self.futures.append(self._executor.submit(add_albums_tracks, self._spot_conn, album_ids,
+                                                  self._writer))
+
+    def add(self, albums):
+        """
+
+        Add albums, that weren't delivered before, hand over all full batches
+
+        """
+        delivered = get_delivered()
+        album_ids = [album['id'] for album in albums if not delivered.has_album(album['id'])]
+        with self._lock:
+            self._album_ids.extend(album_ids)
+            while len(self._album_ids) >= ALBUMS_PER_REQUEST:
+                self._submit(self._album_ids[:ALBUMS_PER_REQUEST])
+                del self._album_ids[:ALBUMS_PER_REQUEST]
+
+    def check_artist(self, artist_info):
+        """
+
+        Find new albums of artist and add them
+
+        """
+        self.add(get_new_albums(self._spot_conn, artist_info))
+
+    def flush(self):
+        """
+
+        Hand over the last, not yet full batch
+
+        """
+        with self._lock:
+            if self._album_ids:
+                self._submit(self._album_ids)
+                self._album_ids = []
+
+
+class WorkQueue:
+    """
+
+    Hand tasks to an executor, but only so many at once
+
+    `submit` waits while `limit` tasks aren't done yet, so a fast source
+    can't queue up work for the whole library at once. The first error of
+    a task is raised by the next `submit` or `wait`.
+
+    """
+
+    def __init__(self, executor, limit):
+        self._executor = executor
+        self._slots = threading.Semaphore(limit)
+        self._cond = threading.Condition()
+        self._errors = []
+        self.submitted = 0
+        self.done = 0
+
+    def _finished(self, future):
+        with self._cond:
+            self.done += 1
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
+            self._cond.notify_all()
+        self._slots.release()
+
+    def _raise_error(self):
+        if self._errors:
+            raise self._errors[0]
+
+    def submit(self, func, *args):
+        """
+
+        Submit func(*args), once there is a free slot
+
+        """
+        self._slots.acquire()
+        with self._cond:
+            self._raise_error()
+            self.submitted += 1
+        self._executor.submit(func, *args).add_done_callback(self._finished)
+
+    def wait(self, timeout=None):
+        """
+
+        Wait until all tasks are done, `False` if timeout came first
+
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.done == self.submitted, timeout)
+            self._raise_error()
+            return self.done == self.submitted
+
+
+class PlaylistWriter:
+    """
+
+    Last stage of a run: write songs into the playlist while the run goes on
+
+    Songs can be put in from any thread. A thread of its own writes them
+    TRACKS_PER_WRITE at a time, or whatever there is, once no new songs came
+    in for WRITE_AFTER seconds. The queue in between is bounded, so if
+    Spotify takes the songs slower than we find them, `put` waits. Once the
+    writer is closed or a write failed, `put` raises instead.
+
+    Examples
+    --------
+    >>> writer = PlaylistWriter(spot_conn, '37i9dQZF1DXcBWIGoYBM5M')
+    >>> writer.put(['spotify:track:4uLU6hMCjMI75M1A2tKUQC'])
+    >>> writer.close()
+    >>> writer.written
+    1
+    """
+
+    def __init__(self, spot_conn, playlist_id):
+        self._spot_conn = spot_conn
+        self._playlist_id = playlist_id
+        self._username = conf.get_key('Auth', 'username')
+        self._queue = queue.Queue(maxsize=TRACKS_PER_WRITE * WRITE_QUEUE_CHUNKS)
+        self._error = None
+        self._closed = threading.Event()
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="playlist-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, track_uris):
+        """
+
+        Queue songs for the playlist, wait if the queue is full
+
+        Raises the error of a failed write, or RuntimeError if the writer is
+        closed, so nobody waits on a queue that isn't emptied anymore.
+
+        """
+        for track_uri in track_uris:
+            while True:
+                if self._error is not None:
+                    raise self._error
+                if self._closed.is_set():
+                    raise RuntimeError("The playlist writer is closed already")
+                try:
+                    self._queue.put(track_uri, timeout=WRITE_AFTER)
+                    break
+                except queue.Full:
+                    continue
+
+    def _write(self, chunk):
+        if self._error is not None:
+            return # Keep taking songs, so nobody waits on a full queue forever
+        try:
+            self._spot_conn.user_playlist_add_tracks(self._username, self._playlist_id, chunk)
+            self.written += len(chunk)
+            get_delivered().add_tracks(chunk)
+        except Exception as error: # pylint: disable=broad-except
+            self._error = error
+
+    def _run(self):
+        chunk = []
+        while True:
+            try:
+                track_uri = self._queue.get(timeout=WRITE_AFTER if chunk else None)
+            except queue.Empty:
+                self._write(chunk)
+                chunk = []
+                continue
+            if track_uri is None:
+                break
+            chunk.append(track_uri)
+            if len(chunk) == TRACKS_PER_WRITE:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+
+    def close(self):
+        """
+
+        Write the rest and stop, raise the error if a write failed
+
+        """
+        self._closed.set()
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
 
 
 def get_user_playlists(spot_conn):
@@ -695,21 +1256,14 @@ def get_user_playlists(spot_conn):
     Saved playlists from other people also get added
 
     """
-    playlists_page = spot_conn.current_user_playlists()
-
     playlists = []
 
-    for playlist in playlists_page['items']:
+    for playlist in iter_items(spot_conn, 'current_user_playlists'):
         playlists.append({'name': playlist['name'],
                           'owner': playlist['owner'],
-                          'id': playlist['id']})
-
-    while playlists_page['next']:
-        playlists_page = spot_conn.next(playlists_page)
-        for playlist in playlists_page['items']:
-            playlists.append({'name': playlist['name'],
-                              'owner': playlist['owner'],
-                              'id': playlist['id']})
+                          'id': playlist['id'],
+                          'snapshot_id': playlist['snapshot_id'],
+                          'total_tracks': playlist['tracks']['total']})
 
     return playlists
 
@@ -724,7 +1278,7 @@ def choose_dest_playlist(spot_conn):
 
     choices = list(map(lambda playlist: (playlist['name'], ""), playlists))
 
-    text = r"""To which \ZbSpotify playlist\Zn should those %d songs be added to?""" % (len(ALL_SONGS))
+    text = r"""To which \ZbSpotify playlist\Zn should the new songs be added to?"""
 
     size = get_window_size((10, len(choices)),
                        (15, len(max(choices, key=lambda item: len(item[0]))[0])))
@@ -755,28 +1309,77 @@ def choose_playlists(spot_conn):
     return False
 
 
-def check_artist_top_songs(spot_conn, artist_id):
+def check_artist_top_songs(spot_conn, artist_id, market):
     """
 
-    Get Top 10 songs of artist, add them to the frey
+    Get Top 10 songs of artist in market, cached for top_tracks_ttl hours
 
     """
+    return get_cache().fetch(conf.get_top_tracks_ttl(),
+                             functools.partial(fetch_artist_top_songs, spot_conn),
+                             'artist_top_tracks', artist_id, market)
 
-    country = conf.get_key('Other', 'country')
-    top_tracks = spot_conn.artist_top_tracks(artist_id, country=country if country else "US")
+def fetch_artist_top_songs(spot_conn, artist_id, market):
+    """
 
-    num_tracks = 0
-    track_names = []
-    track_uris = []
-    tracks = top_tracks['tracks']
-    for track in tracks:
-        track_name = track['name']
-        track_names.append(track_name)
-        track_uris.append(track['uri'])
-        ALL_SONGS.add(track['uri'])
-        num_tracks += 1
-    num_tracks -= delete_duplicate_songs(track_names, track_uris)
-    return num_tracks
+    Get Top 10 songs of artist in market from Spotify, only what we need of them
+
+    """
+    return [{'name': track['name'], 'uri': track['uri'],
+             'artists': [{'id': artist['id']} for artist in track['artists']]}
+            for track in spot_conn.artist_top_tracks(artist_id, country=market)['tracks']]
+
+
+def iter_artists(spot_conn, source, playlists=None):
+    """
+
+    First stage of a run: every artist of source once, as [name, id]
+
+    Artists are yielded as soon as their page or playlist is there, also
+    recorded in ARTISTS_SET and ARTISTS_DICT. SOURCE_TOTAL is set as soon
+    as the source tells how big it is.
+
+    """
+    global SOURCE_TOTAL
+    SOURCE_TOTAL = None
+    if source == 'allowlist':
+        SOURCE_TOTAL = fi.get_length_of_list(fi.Lists.ALLOWLIST)
+        return iter_list_artists(spot_conn, fi.Lists.ALLOWLIST)
+    if source == 'saved':
+        return iter_followed_artists(spot_conn)
+    # Playlists given by id don't know their size
+    totals = [playlist.get('total_tracks') for playlist in playlists]
+    if None not in totals:
+        SOURCE_TOTAL = sum(totals)
+    return iter_playlist_artists(spot_conn, playlists)
+
+
+def iter_list_artists(spot_conn, list_name):
+    """
+
+    Get all artists from list
+
+    Entries with id come first. Entries without one are searched for all
+    at once afterwards, and the ids found are written back to the list in
+    one go. Entries without a match are left out.
+
+    """
+    this_list, _ = fi.get_list(list_name)
+    #artist[0] == name; artist[1] == id
+    for artist in this_list:
+        if len(artist) == 2 and add_artist(artist):
+            yield artist
+    found = []
+    try:
+        for artist_name, artist_id in resolve_artist_ids(
+                spot_conn, [artist[0] for artist in this_list if len(artist) == 1]):
+            if artist_id is None:
+                continue
+            found.append([artist_name, artist_id])
+            if add_artist(found[-1]):
+                yield found[-1]
+    finally:
+        fi.add_missing_ids(list_name, found)
 
 
 def get_artists_from_list(spot_conn, list_name):
@@ -786,259 +1389,390 @@ def get_artists_from_list(spot_conn, list_name):
 
     """
     i = 0
+    length = fi.get_length_of_list(list_name)
     DIALOG.gauge_start(text="Gathering artists", percent=0)
-    this_list, length = fi.get_list(list_name)
-    #artist[0] == name; artist[1] == id
-    for artist in this_list:
-        DIALOG.gauge_update(math.floor((i/length)*100))
-        if isinstance(artist, list):
-            if len(artist) == 1:
-                artist_id = check_and_get_artist_id(spot_conn, artist[0])
-                fi.add_missing_id(list_name, [artist[0], artist_id], artist)
-                artist.append(artist_id)
-        elif isinstance(artist, str):
-            artist_id = check_and_get_artist_id(spot_conn, artist)
-            fi.add_missing_id(list_name, [artist, artist_id], [artist])
-            artist = [artist].append(artist_id)
-        else:
-            raise TypeError("Artist entry is neither list nor string type")
-        ARTISTS_DICT[artist[0]] = artist[1]
-        ARTISTS_SET.add(artist[1])
+    for _ in iter_list_artists(spot_conn, list_name):
         i += 1
+        DIALOG.gauge_update(math.floor((i/length)*100))
     DIALOG.gauge_stop()
 
-def get_artists_from_followed(spot_conn):
+def add_artist(artist_info):
     """
 
-    Get all artists that you are following
+    Add artist ([name, id]) to this run, `False` if it's already in there
 
     """
-    artists_page = spot_conn.current_user_followed_artists(limit=10)
+    if artist_info[1] in ARTISTS_SET:
+        return False
+    ARTISTS_SET.add(artist_info[1])
+    ARTISTS_DICT[artist_info[0]] = artist_info[1]
+    return True
 
-    total_artists = artists_page['artists']['total']
-    clear_screen()
-    DIALOG.gauge_start(text="Gathering artists", percent=0)
+def add_artists(artists, blocklist):
+    """
 
-    for artist in artists_page['artists']['items']:
-        ARTISTS_SET.add(artist['id'])
-        ARTISTS_DICT[artist['name']] = artist['id']
+    Add artists (dict of id to name) to this run, except for blocklisted ones
 
-    i = len(artists_page['artists']['items'])
-    while artists_page['artists']['next']:
-        DIALOG.gauge_update(round((i/total_artists)*100))
-        artists_page = spot_conn.next(artists_page['artists'])
-        for artist in artists_page['artists']['items']:
-            ARTISTS_DICT[artist['name']] = artist['id']
-            ARTISTS_SET.add(artist['id'])
-        i += len(artists_page['artists']['items'])
+    Returns
+    -------
+    List of [name, id] of the artists that weren't in this run yet
 
+    """
+    return [[artist_name, artist_id]
+            for artist_id, artist_name in blocklist.filter(artists).items()
+            if add_artist([artist_name, artist_id])]
 
-    _ = fi.remove_blocklisted(ARTISTS_DICT, ARTISTS_SET)
-    DIALOG.gauge_stop()
-    return True
 
+def iter_followed_artists(spot_conn):
+    """
+
+    Get all artists that you are following, page by page
+    The first page sets SOURCE_TOTAL.
 
-def get_artists_from_playlist(spot_conn):
     """
+    global SOURCE_TOTAL
+    blocklist = fi.Blocklist()
+    for artists_page in iter_cursor_pages(spot_conn, 'current_user_followed_artists', 'artists'):
+        SOURCE_TOTAL = artists_page['total']
+        yield from add_artists({artist['id']: artist['name'] for artist in artists_page['items']},
+                               blocklist)
 
-    Get all artists from specific playlist
 
+def get_playlist_artists(spot_conn, playlist):
     """
-    playlists = choose_playlists(spot_conn)
-    if not playlists:
-        return False
 
-    # Get set of all needed artist id's
-    fst_artist = True
-    #for playlist in playlists['items']:
-    i = 0
-    DIALOG.gauge_start(text="Gathering artists", percent=0)
-    for playlist in playlists:
-        DIALOG.gauge_update(round((i/len(playlists))*100))
-        i += 1
+    Get first artist of every track of playlist, as dict of id to name
 
-        playlist_tracks = []
-        track_page = spot_conn.playlist_tracks(playlist['id'],
-                                               limit=100)
-        playlist_tracks.extend(track_page['items'])
-        while track_page['next']:
-            track_page = spot_conn.next(track_page)
-            playlist_tracks.extend(track_page['items'])
-        for track in playlist_tracks:
-            fst_artist = True
-            if not track['is_local']:
-                for artist in track['track']['artists']:
-                    if fst_artist:
-                        ARTISTS_SET.add(artist['id'])
-                        ARTISTS_DICT[artist['name']] = artist['id']
-                        fst_artist = False
-
-    _ = fi.remove_blocklisted(ARTISTS_DICT, ARTISTS_SET)
-    DIALOG.gauge_stop()
-    return True
+    Cached by snapshot id, so only playlists that changed since are scanned
+    again. Playlists without a snapshot id (e.g. given by id in batch mode)
+    cost one request to look it up.
 
+    """
+    snapshot_id = playlist.get('snapshot_id')
+    if snapshot_id is None:
+        snapshot_id = spot_conn.playlist(playlist['id'], fields='snapshot_id')['snapshot_id']
+    return get_cache().fetch(None, functools.partial(fetch_playlist_artists, spot_conn),
+                             'playlist_artists', playlist['id'],
+                             key_args=(playlist['id'], snapshot_id))
 
-def get_top_songs(spot_conn):
+
+def fetch_playlist_artists(spot_conn, playlist_id):
     """
 
-    Get top songs from artists
+    Get first artist of every track of playlist from Spotify, as dict of id to name
+
+    Only the fields we need are requested, and pages are processed as they
+    come in, so big playlists don't end up in memory as a whole.
 
     """
-    inv_artists_dict = {v: k for k, v in ARTISTS_DICT.items()}
-    i = 0
+    artists = {}
+    for track_page in iter_pages(spot_conn, 'playlist_tracks', playlist_id,
+                                 fields=PLAYLIST_FIELDS):
+        # Only the first artist of each track counts
+        for track in track_page['items']:
+            if not track['is_local'] and track['track'] and track['track']['artists']:
+                artist = track['track']['artists'][0]
+                artists[artist['id']] = artist['name']
+    return artists
 
-    size = get_window_size(None, (10, len(max(inv_artists_dict, key=len))))
-    DIALOG.gauge_start(text="Finding tracks", percent=0, width=size[1], colors=True)
-    for artist_id in ARTISTS_SET:
-        artist_name = inv_artists_dict[artist_id]
-        DIALOG.gauge_update(text=r"Getting top tracks by \Zb%s\Zn" % (artist_name),
-                            percent=round((i/len(ARTISTS_SET))*100), update_text=True)
-        i += 1
-        check_artist_top_songs(spot_conn, artist_id)
 
-    DIALOG.gauge_stop()
+def iter_playlist_artists(spot_conn, playlists):
+    """
 
+    Get all artists from playlists, playlist by playlist as they are done
+    Playlists are scanned at the same time.
 
-def get_new_songs(spot_conn):
     """
+    blocklist = fi.Blocklist()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(conf.get_workers(), len(playlists)))) as executor:
+        futures = [executor.submit(get_playlist_artists, spot_conn, playlist)
+                   for playlist in playlists]
+        for future in concurrent.futures.as_completed(futures):
+            yield from add_artists(future.result(), blocklist)
 
-    Get new songs
 
+def get_top_songs(spot_conn):
     """
-    inv_artists_dict = {v: k for k, v in ARTISTS_DICT.items()}
-    i = 1
-    skip_all = False
-    size = get_window_size(None, (32, len(max(inv_artists_dict, key=len))))
-    DIALOG.gauge_start(text="Finding tracks", percent=0, width=size[1], colors=True)
-    for artist_id in ARTISTS_SET:
-        artist_name = inv_artists_dict[artist_id]
-        artist_info = [artist_name, artist_id]
-        DIALOG.gauge_update(text="Finding tracks by \Zb%s\Zn" % (artist_name),
-                            percent=math.floor((i/len(ARTISTS_SET))*100), update_text=True)
-        i += 1
-        new_artist = False
-        if not fi.check_if_on_list(fi.Lists.ALLOWLIST, artist_info):
-            new_artist = True
-            # Oh nice, a new one
-            if fi.check_if_on_list(fi.Lists.GREYLIST, artist_info):
-                continue # Just ignore Greylist ones
-                #text = """This one is already on your greylist! \
-                #          What should happen to %s?""" % (artist_name)
-                #choices = [("T", "Ignore new songs here, only add Top 10 songs")] + \
-                #          standard_choices + \
-                #          [("TA", "Ignore all new Greylist songs here, \
-                #                  add Top 10 songs of all Greylist entries")]
-            fi.add_to_list(fi.Lists.GREYLIST, artist_info)
-            fi.sort_list(fi.Lists.GREYLIST)
-            if not skip_all:
-                text = """\Zb%s\Zn is a new one! Added to greylist.
-What should happen next?""" % (artist_name)
-
-                standard_choices = [
-                                    ("I", "Ignore new songs by %s" % (artist_name)),
-                                    ("IA", "Ignore new songs from ALL new artists"),
-                                    ("W", "Add new songs and add %s to allowlist" % (artist_name)),
-                                    ("WA", "Add new songs and send ALL new artists to allowlist"),
-                                    ("B", "Add %s to blocklist" % (artist_name)),
-                                    ("A", "Only add to new songs by %s" % (artist_name)),
-                                    ("AA", "Add new songs from ALL new artists"),
-                                    ("BA", "Send ALL new artists to blocklist"),
-                                   ]
-
-                choices = standard_choices
-
-                #DIALOG.clear()
-                size = get_window_size((8, len(choices)),
-                                       (22, max(len(max(choices, key=lambda item: len(item[1]))[1]),
-                                               len(artist_name))))
-                code, tag = DIALOG.menu(text, choices=choices, no_tags=True, colors=True,
-                                        height=size[0], width=size[1])
-                if code != DIALOG.OK:
-                    return False
-                if tag in ("AA", "WA", "IA", "BA"):
-                    skip_all = True
-                size = get_window_size(None, (32, len(max(inv_artists_dict, key=len))))
-                DIALOG.gauge_start(text=r"Finding tracks by \Zb%s\Zn" % (artist_name),
-                                   colors=True, percent=round((i/len(ARTISTS_SET))*100))
-            else:
-                continue
 
-        if not new_artist or tag in ("A", "AA"):
-            check_artist_albums(spot_conn, artist_info)
-        elif tag in ("W", "WA"):
-            fi.add_to_list(fi.Lists.ALLOWLIST, artist_info)
-            fi.sort_list(fi.Lists.ALLOWLIST)
-            check_artist_albums(spot_conn, artist_info)
-        elif tag in ("B", "BA"):
-            fi.add_to_list(fi.Lists.BLOCKLIST, artist_info)
-            fi.sort_list(fi.Lists.BLOCKLIST)
-        elif tag in ("I", "IA"):
-            pass
-        else:
-            pass
+    Get top songs from artists
 
-    DIALOG.gauge_stop()
-    return True
+    Top songs of all artists are fetched at the same time, duplicates
+    across artists are removed in one go, once they are all there.
 
-def get_songs(spot_conn, state):
     """
+    market = conf.CONFIG.country()
+    artist_ids = list(ARTISTS_SET)
+    top_songs = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=conf.get_workers())
+    size = get_window_size(None, (32, 32))
+    DIALOG.gauge_start(text="Finding tracks", percent=0, width=size[1], colors=True)
+    try:
+        futures = {executor.submit(check_artist_top_songs, spot_conn, artist_id, market): artist_id
+                   for artist_id in artist_ids}
+        for future in concurrent.futures.as_completed(futures):
+            top_songs[futures[future]] = future.result()
+            update_fetch_gauge(len(top_songs), len(artist_ids),
+                               text="Getting top tracks (%.1f requests/s, %d waiting, "
+                                    "%d%% cached)"
+                               % (spot_conn.rate, spot_conn.queue_depth,
+                                  get_cache().hit_rate()*100))
+    except BaseException:
+        # Tasks still running could write into the playlist, wait until they're done
+        executor.shutdown(cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    tracks = [track for artist_id in artist_ids for track in top_songs[artist_id]]
+    track_names = [track['name'] for track in tracks]
+    track_uris = [track['uri'] for track in tracks]
+    track_artists = [{artist['id'] for artist in track['artists']} for track in tracks]
+    delete_duplicate_songs(track_names, track_uris, track_artists)
+    add_songs(track_uris, WRITER)
+    DIALOG.gauge_stop()
 
-    Fetch songs from any source
 
+def update_fetch_gauge(done, total, text=None):
     """
-    source = conf.get_key('Other', 'source')
-    if state == States.TOP_10_GREY:
-        get_artists_from_list(spot_conn, fi.Lists.GREYLIST)
-        get_top_songs(spot_conn)
-    elif state == States.NEW_RELEASES:
-        if source == 'allowlist':
-            get_artists_from_list(spot_conn, fi.Lists.ALLOWLIST)
-        elif source == 'saved':
-            get_artists_from_followed(spot_conn)
-        else: # Playlist(s)
-            if not get_artists_from_playlist(spot_conn):
-                state = States.START
-                return False, state
 
-        if not get_new_songs(spot_conn):
-            state = States.START
-            return False, state
+    Show how much of the work so far is done, nothing if total is None
+
+    """
+    if total is None:
+        percent = 0
+    else:
+        percent = math.floor((done/total)*100) if total else 100
+    if text is None:
+        DIALOG.gauge_update(percent)
     else:
-        # Wrong state
-        DIALOG.msgbox("You ended up in a wrong state, back to the menu")
-        return False, None
-    return True, None
+        DIALOG.gauge_update(text=text, percent=percent, update_text=True)
 
-def add_songs_to_playlist(spot_conn):
+
+def decide_new_artists(new_artists):
     """
 
-    Add new songs to specific playlist
+    Let the user decide on all new artists at once
+
+    Either one action for all of them, or a checklist to pick artists for
+    each action, until all are decided or the user is done. Artists
+    without a decision are ignored.
+
+    Parameters
+    ----------
+    new_artists : List of [name, id]
+
+    Returns
+    -------
+    Dict of artist id to tag (I, W, B or A), `None` if the user aborted
 
     """
-    song_list = []
-    text = r"""\n\nDo you wanna add all those \Zb%d\Zn songs?""" % (len(ALL_SONGS))
+    names = ", ".join(artist_info[0] for artist_info in new_artists)
+    text = r"""\Zb%d\Zn new artists, added to greylist:
+%s
 
-    size = get_window_size((5, 5), (10, 15))
-    if DIALOG.yesno(text, height=size[0], width=size[1], colors=True) == DIALOG.OK:
-        dest_playlist = choose_dest_playlist(spot_conn)
-        for song in ALL_SONGS:
-            song_list.append(song)
-        chunked_list = [song_list[i:i + 10] for i in range(0, len(song_list), 10)]
-        i = 0
-        DIALOG.gauge_start(text="Add songs to playlist", percent=0)
-        for chunk in chunked_list:
-            DIALOG.gauge_update(percent=round((i/len(chunked_list))*100))
-            i += 1
-            spot_conn.user_playlist_add_tracks(conf.get_key('Auth', 'username'),
-                                               dest_playlist, chunk)
+What should happen next?""" % (len(new_artists), names)
+    choices = [("C", "Choose for each artist"),
+               ("IA", "Ignore new songs from ALL new artists"),
+               ("WA", "Add new songs and send ALL new artists to allowlist"),
+               ("AA", "Add new songs from ALL new artists"),
+               ("BA", "Send ALL new artists to blocklist")]
+    size = get_window_size((10, len(choices) + len(names) // 40),
+                           (22, len(max(choices, key=lambda item: len(item[1]))[1])))
+    code, tag = DIALOG.menu(text, choices=choices, no_tags=True, colors=True,
+                            height=size[0], width=size[1])
+    if code != DIALOG.OK:
+        return None
+    if tag != "C":
+        return {artist_info[1]: tag[0] for artist_info in new_artists}
+
+    decisions = {}
+    undecided = list(new_artists)
+    while undecided:
+        choices = [(artist_info[1], artist_info[0], False) for artist_info in undecided]
+        size = get_window_size((10, len(choices)),
+                               (22, len(max(choices, key=lambda item: len(item[1]))[1])))
+        code, tags = DIALOG.checklist(text="Which new artists do you want to decide on now?",
+                                      cancel_label="Done", colors=True, choices=choices,
+                                      no_tags=True, height=size[0], width=size[1])
+        if code != DIALOG.OK or not tags:
+            break
+        text = r"What should happen to these \Zb%d\Zn artists?" % (len(tags))
+        choices = [("I", "Ignore their new songs"),
+                   ("W", "Add new songs and add them to allowlist"),
+                   ("A", "Only add their new songs"),
+                   ("B", "Add them to blocklist")]
+        size = get_window_size((7, len(choices)),
+                               (25, len(max(choices, key=lambda item: len(item[1]))[1])))
+        code, tag = DIALOG.menu(text, choices=choices, cancel_label="Back", no_tags=True,
+                                height=size[0], width=size[1], colors=True)
+        if code != DIALOG.OK:
+            continue
+        for artist_id in tags:
+            decisions[artist_id] = tag
+        undecided = [artist_info for artist_info in undecided if artist_info[1] not in decisions]
+    return decisions
 
-        DIALOG.gauge_stop()
-    else:
-        return False
+def get_new_songs(spot_conn, artists, policy=None):
+    """
+
+    Get new songs of artists, while they still come in from the source
+
+    Known artists are handed to a pool of worker threads right away, but
+    only a few per worker at once, so the source is read as fast as the
+    workers go. New artists are queued and decided on all at once, at the
+    end, while their albums and tracks are already fetched into the cache
+    in the background. Their songs are only added once the decision is made.
+    With a policy (I, W, B or A), new artists get that without asking.
+
+    Parameters
+    ----------
+    artists : Iterable of [name, id], e.g. from iter_artists, that sets SOURCE_TOTAL
+
+    """
+    new_artists = []
+    skipped = 0
+    read = 0
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=conf.get_workers())
+    work = WorkQueue(executor, conf.get_workers() * ARTISTS_IN_FLIGHT)
+    batcher = AlbumBatcher(spot_conn, executor, WRITER)
+    size = get_window_size(None, (32, 32))
+    DIALOG.gauge_start(text="Finding tracks", percent=0, width=size[1], colors=True)
+    try:
+        for artist_info in artists:
+            if SOURCE_TOTAL is None:
+                update_fetch_gauge(work.done + skipped, None,
+                                   text=r"Finding tracks by \Zb%s\Zn (%d artists, %d songs so far)"
+                                   % (artist_info[0], read + 1, len(ALL_SONGS)))
+            else:
+                # Artists not read yet are work still to do
+                update_fetch_gauge(work.done + skipped,
+                                   work.submitted + skipped + max(SOURCE_TOTAL - read, 0),
+                                   text=r"Finding tracks by \Zb%s\Zn (%d of %d artists, "
+                                        r"%d songs so far)"
+                                   % (artist_info[0], read + 1, SOURCE_TOTAL, len(ALL_SONGS)))
+            read += 1
+            if fi.check_if_on_list(fi.Lists.ALLOWLIST, artist_info):
+                work.submit(batcher.check_artist, artist_info)
+            elif fi.check_if_on_list(fi.Lists.GREYLIST, artist_info):
+                skipped += 1 # Just ignore Greylist ones
+            else:
+                # Oh nice, a new one
+                fi.add_to_list(fi.Lists.GREYLIST, artist_info)
+                NEW_ARTISTS.append(artist_info[0])
+                new_artists.append(artist_info)
+                # Fetch their songs into the cache already, in case they get added
+                work.submit(prefetch_artist_songs, spot_conn, artist_info[1])
+
+        if not new_artists:
+            decisions = {}
+        elif policy:
+            decisions = {artist_info[1]: policy for artist_info in new_artists}
+        else:
+            DIALOG.gauge_stop()
+            decisions = decide_new_artists(new_artists)
+            if decisions is None:
+                executor.shutdown(cancel_futures=True)
+                return False
+            DIALOG.gauge_start(text="Finding tracks", percent=0, width=size[1], colors=True)
+
+        for artist_info in new_artists:
+            tag = decisions.get(artist_info[1], "I")
+            if tag in ("W", "A"):
+                if tag == "W":
+                    fi.add_to_list(fi.Lists.ALLOWLIST, artist_info)
+                work.submit(batcher.check_artist, artist_info)
+            else:
+                if tag == "B":
+                    fi.add_to_list(fi.Lists.BLOCKLIST, artist_info)
+                skipped += 1
+
+        while not work.wait(timeout=0.5):
+            update_fetch_gauge(work.done + skipped, work.submitted + skipped,
+                               text="Finding albums (%.1f requests/s, %d waiting, %d%% cached, "
+                                    "%d songs so far)"
+                               % (spot_conn.rate, spot_conn.queue_depth,
+                                  get_cache().hit_rate()*100, len(ALL_SONGS)))
+        # All albums are known now, fetch the tracks of the rest
+        batcher.flush()
+        for future in concurrent.futures.as_completed(batcher.futures):
+            future.result()
+            update_fetch_gauge(sum(1 for batch in batcher.futures if batch.done()),
+                               len(batcher.futures),
+                               text="Finding tracks (%.1f requests/s, %d waiting, %d%% cached, "
+                                    "%d songs so far)"
+                               % (spot_conn.rate, spot_conn.queue_depth,
+                                  get_cache().hit_rate()*100, len(ALL_SONGS)))
+    except BaseException:
+        # Tasks still running could write into the playlist, wait until they're done
+        executor.shutdown(cancel_futures=True)
+        raise
+    executor.shutdown()
+    DIALOG.gauge_stop()
     return True
 
+def get_songs(spot_conn, state, source=None, playlists=None, policy=None,
+              release_filter=None, dest_playlist=None):
+    """
+
+    Fetch songs from any source, and write them into dest_playlist as they come
+
+    The stages of a run (artists, albums, tracks, playlist) all work at the
+    same time, connected by bounded queues, so the first songs land in the
+    playlist within seconds and memory doesn't grow with the library.
+    Source, playlists, policy for new artists and release filter default to
+    the config, asking the user and the time of the last check.
+
+    """
+    global RELEASE_FILTER, WRITER
+    if source is None:
+        source = conf.CONFIG.source()
+    if release_filter is None:
+        release_filter = conf.ReleaseDateFilter(conf.read_time())
+    RELEASE_FILTER = release_filter
+    # Every run starts without artists and songs, so nothing counts as duplicate of an older run
+    ARTISTS_SET.clear()
+    ARTISTS_DICT.clear()
+    ALL_SONGS.clear()
+    DEDUPER.clear()
+    ISRC_DEDUPER.clear()
+    with RELEASE_TYPES_LOCK:
+        RELEASE_TYPES.clear()
+    del NEW_ARTISTS[:]
+    if state == States.NEW_RELEASES and source not in ('allowlist', 'saved') and not playlists:
+        playlists = choose_playlists(spot_conn)
+        if not playlists:
+            state = States.START
+            return False, state
+    WRITER = PlaylistWriter(spot_conn, dest_playlist) if dest_playlist else None
+    result = True, None
+    try:
+        if state == States.TOP_10_GREY:
+            get_artists_from_list(spot_conn, fi.Lists.GREYLIST)
+            get_top_songs(spot_conn)
+        elif state == States.NEW_RELEASES:
+            if not get_new_songs(spot_conn, iter_artists(spot_conn, source, playlists), policy):
+                state = States.START
+                result = False, state
+        else:
+            # Wrong state
+            DIALOG.msgbox("You ended up in a wrong state, back to the menu")
+            result = False, None
+    except BaseException:
+        if WRITER is not None:
+            # The error of the run is the one to show, not one of writing the rest
+            try:
+                WRITER.close()
+            except Exception as error: # pylint: disable=broad-except
+                print("Couldn't write the rest of the songs:", error, file=sys.stderr)
+        raise
+    if WRITER is not None:
+        WRITER.close()
+    return result
+
 def clear_screen():
     """ Clear screen to avoid merging of output """
+    if isinstance(DIALOG, HeadlessDialog):
+        return
     # This program comes with ncurses
     program = "clear"
 
@@ -1046,5 +1780,187 @@ def clear_screen():
                                      stderr=None, close_fds=True)
     _ = process_clear.wait()
 
+def parse_date(date_string):
+    """
+
+    Parse YYYY-MM-DD for argparse
+
+    """
+    try:
+        return datetime.strptime(date_string, "%Y-%m-%d")
+    except ValueError as error:
+        raise argparse.ArgumentTypeError("Expected YYYY-MM-DD, got %s" % (date_string)) from error
+
+def parse_args(argv):
+    """
+
+    Parse command line arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Get new songs of artists from Spotify",
+        epilog="Exit codes in batch mode: %d done, %d run failed, %d wrong arguments, "
+               "%d no Spotify token" % (EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_NO_TOKEN))
+    parser.add_argument('--batch', action='store_true',
+                        help="run without dialogs, e.g. from cron")
+    parser.add_argument('--mode', choices=('new', 'top'), default='new',
+                        help="new releases, or top 10 songs of the greylist")
+    parser.add_argument('--source', choices=('playlists', 'allowlist', 'saved'),
+                        help="where artists come from, defaults to the config")
+    parser.add_argument('--playlists', nargs='+', metavar='ID', default=[],
+                        help="playlists to get artists from, for source playlists")
+    parser.add_argument('--since', type=parse_date, metavar='YYYY-MM-DD',
+                        help="get releases after this day, defaults to the last check")
+    parser.add_argument('--until', type=parse_date, metavar='YYYY-MM-DD',
+                        help="get releases up to this day")
+    parser.add_argument('--playlist', metavar='ID',
+                        help="playlist to add the songs to")
+    parser.add_argument('--new-artists', choices=NEW_ARTIST_POLICIES,
+                        help="what happens to new artists: I(gnore), W (allowlist), "
+                             "B(locklist) or A(dd songs), defaults to new_artist_policy")
+    parser.add_argument('--summary', metavar='FILE', default='-',
+                        help="where to write the JSON summary, - for stdout")
+    parser.add_argument('--export-lists', action='store_true',
+                        help="write the lists from the SQLite backend back to their CSV files")
+    args = parser.parse_args(argv)
+    if args.batch:
+        if not args.playlist:
+            parser.error("--batch needs --playlist")
+        source = args.source or conf.CONFIG.source()
+        if args.mode == 'new' and source not in ('allowlist', 'saved') and not args.playlists:
+            parser.error("--batch with source playlists needs --playlists")
+        if args.new_artists is None:
+            # Checked now, before any request goes out, there is nobody to ask later
+            policy = conf.get_key('Other', 'new_artist_policy', fallback='I')
+            if policy not in NEW_ARTIST_POLICIES:
+                parser.error("new_artist_policy in the config has to be one of %s, not %r"
+                             % (", ".join(NEW_ARTIST_POLICIES), policy))
+    return args
+
+def write_summary(summary, path):
+    """
+
+    Write run summary as JSON
+
+    """
+    if path == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(path, 'w') as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+def export_main():
+    """
+
+    Export the lists from SQLite back to their CSV files, for --export-lists
+
+    """
+    if not fi.export_lists():
+        print("The lists aren't kept in SQLite (backend in [Lists]), nothing to export",
+              file=sys.stderr)
+        return EXIT_USAGE
+    print("Exported lists to " + ", ".join(list_name.path for list_name in
+                                             (fi.Lists.ALLOWLIST, fi.Lists.GREYLIST,
+                                              fi.Lists.BLOCKLIST)))
+    return EXIT_OK
+
+def next_last_check(args, now):
+    """
+
+    Get the time to keep as last check after a successful batch run
+
+    An explicit --since doesn't move the last check. With --until, releases
+    after that day weren't looked at, so it only moves up to that day.
+
+    Returns
+    -------
+    datetime, `None` to keep the last check as it is
+
+    Examples
+    --------
+    >>> args = parse_args(['--batch', '--source', 'allowlist', '--playlist', 'PL',
+    ...                    '--until', '2026-02-01'])
+    >>> next_last_check(args, datetime(2026, 10, 17))
+    datetime.datetime(2026, 2, 1, 0, 0)
+    >>> next_last_check(parse_args(['--batch', '--source', 'allowlist', '--playlist', 'PL']),
+    ...                 datetime(2026, 10, 17))
+    datetime.datetime(2026, 10, 17, 0, 0)
+    >>> next_last_check(parse_args(['--batch', '--source', 'allowlist', '--playlist', 'PL',
+    ...                             '--since', '2024-01-01']), datetime(2026, 10, 17)) is None
+    True
+    """
+    if args.since is not None:
+        return None
+    if args.until is not None:
+        return min(args.until, now)
+    return now
+
+def batch_main(args):
+    """
+
+    Run once without any dialog, with everything coming from the arguments and config
+
+    Returns
+    -------
+    Exit code
+
+    """
+    global DIALOG
+    DIALOG = HeadlessDialog()
+    atexit.register(fi.flush_lists)
+    started = time.time()
+    policy = args.new_artists or conf.get_key('Other', 'new_artist_policy', fallback='I')
+    since = args.since or conf.read_time()
+    summary = {'mode': args.mode,
+               'source': args.source or conf.CONFIG.source(),
+               'since': conf.convert_dt_to_iso(since),
+               'until': conf.convert_dt_to_iso(args.until) if args.until else None,
+               'playlist': args.playlist,
+               'new_artist_policy': policy}
+    exit_code = EXIT_OK
+    try:
+        spot_conn = connect(interactive=False)
+        if spot_conn is None:
+            summary['status'] = 'no_token'
+            exit_code = EXIT_NO_TOKEN
+        else:
+            state = States.TOP_10_GREY if args.mode == 'top' else States.NEW_RELEASES
+            done, _ = get_songs(spot_conn, state, source=args.source,
+                                playlists=[{'id': playlist_id} for playlist_id in args.playlists],
+                                policy=policy,
+                                release_filter=conf.ReleaseDateFilter(since, args.until),
+                                dest_playlist=args.playlist)
+            if not done:
+                raise RuntimeError("Could not get songs")
+            last_check = next_last_check(args, datetime.now())
+            if last_check is not None:
+                conf.write_time(last_check)
+            get_watermarks().commit()
+            get_delivered().commit()
+            summary['status'] = 'ok'
+            summary['requests'] = spot_conn.requests
+            summary['cache_hit_rate'] = round(get_cache().hit_rate(), 3)
+    except Exception as error: # pylint: disable=broad-except
+        get_watermarks().discard()
+        get_delivered().commit(albums=False)
+        summary['status'] = 'failed'
+        summary['error'] = "%s: %s" % (type(error).__name__, error)
+        exit_code = EXIT_FAILED
+    fi.flush_lists()
+    summary['artists'] = len(ARTISTS_SET)
+    summary['new_artists'] = list(NEW_ARTISTS)
+    summary['songs'] = len(ALL_SONGS)
+    summary['songs_written'] = WRITER.written if WRITER is not None else 0
+    summary['seconds'] = round(time.time() - started, 1)
+    summary['exit_code'] = exit_code
+    write_summary(summary, args.summary)
+    return exit_code
+
 if __name__ == '__main__':
+    ARGS = parse_args(sys.argv[1:])
+    if ARGS.export_lists:
+        sys.exit(export_main())
+    if ARGS.batch:
+        sys.exit(batch_main(ARGS))
     main()
@@ -0,0 +1,205 @@
+"""
+
+Schedule all requests to Spotify through one rate limiter
+
+Subtasks:
+    - Token bucket for the request rate
+    - Honor Retry-After for all threads at once
+    - Grow and shrink rate and concurrency (AIMD) on 429s and latency
+    - Compare latency per endpoint, against a slowly decaying baseline
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import threading
+import time
+
+# How fast the latency baseline of an endpoint follows the latency, per call
+BASELINE_DECAY = 0.01
+
+class RequestScheduler:
+    """
+
+    Wrap a spotipy.Spotify connection, so that every call goes through the scheduler
+
+    Every call takes a token from a token bucket and a slot of the allowed
+    concurrency. A 429 pauses every thread until Retry-After has passed,
+    halves rate and concurrency, and the call is tried again. Successful calls
+    slowly grow both again, as long as the latency doesn't go up. Endpoints
+    differ a lot in latency, so each one is compared to its own baseline.
+
+    Examples
+    --------
+    >>> spot_conn = RequestScheduler(spotipy.Spotify(auth=token), max_concurrency=8)
+    >>> spot_conn.artist_albums('2dd5mrQZvg6SmahdgVKDzh')
+    {'items': [...], ...}
+    >>> spot_conn.rate, spot_conn.queue_depth
+    (10.5, 3)
+    """
+
+    def __init__(self, spot_conn, rate=10.0, max_rate=50.0, max_concurrency=8, retries=5):
+        self._conn = spot_conn
+        self._cond = threading.Condition()
+        self._rate = rate
+        self._min_rate = 1.0
+        self._max_rate = max_rate
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._concurrency = float(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._active = 0
+        self._waiting = 0
+        self._latency = {}
+        self._base_latency = {}
+        self._retries = retries
+        self.requests = 0
+
+    @property
+    def rate(self):
+        """ Current allowed requests per second """
+        return self._rate
+
+    @property
+    def concurrency(self):
+        """ Current allowed number of requests at the same time """
+        return int(self._concurrency)
+
+    @property
+    def queue_depth(self):
+        """ Number of calls waiting for their turn """
+        return self._waiting
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if not callable(attr):
+            return attr
+        def scheduled(*args, **kwargs):
+            return self.call(attr, *args, **kwargs)
+        return scheduled
+
+    def _refill(self, now):
+        """
+
+        Put tokens back into the bucket, for the time that has passed
+
+        """
+        self._tokens = min(max(1.0, self._rate),
+                           self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def _acquire(self):
+        """
+
+        Wait until there is no pause, a free slot and a token
+
+        """
+        with self._cond:
+            self._waiting += 1
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._cond.wait(self._paused_until - now)
+                    continue
+                if self._active >= max(1, int(self._concurrency)):
+                    self._cond.wait()
+                    continue
+                self._refill(now)
+                if self._tokens < 1:
+                    self._cond.wait((1 - self._tokens) / self._rate)
+                    continue
+                self._tokens -= 1
+                self._active += 1
+                self.requests += 1
+                self._waiting -= 1
+                return
+
+    def _release(self):
+        """
+
+        Give back the slot and wake up waiting threads
+
+        """
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _on_success(self, endpoint, latency):
+        """
+
+        Additive increase, unless latency of the endpoint has gone up a lot
+
+        Latency is smoothed over the last few calls, and compared to a
+        baseline that follows the latency of the endpoint much slower.
+
+        """
+        with self._cond:
+            smoothed = 0.8 * self._latency.get(endpoint, latency) + 0.2 * latency
+            self._latency[endpoint] = smoothed
+            base = self._base_latency.get(endpoint, latency)
+            base += (latency - base) * BASELINE_DECAY
+            self._base_latency[endpoint] = base
+            if smoothed > 2 * base:
+                self._concurrency = max(1.0, self._concurrency * 0.9)
+                return
+            self._rate = min(self._max_rate, self._rate + 1 / self._rate)
+            self._concurrency = min(float(self._max_concurrency),
+                                    self._concurrency + 1 / self._concurrency)
+
+    def _on_throttled(self, retry_after):
+        """
+
+        Multiplicative decrease and pause everyone until Retry-After has passed
+
+        """
+        with self._cond:
+            self._rate = max(self._min_rate, self._rate / 2)
+            self._concurrency = max(1.0, self._concurrency / 2)
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """
+
+        Call func once it's our turn, try again after 429s
+
+        """
+        # The connection we wrap comes from spotipy, so it's already imported by now
+        import spotipy
+        for _ in range(self._retries):
+            self._acquire()
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except spotipy.SpotifyException as error:
+                if error.http_status != 429:
+                    raise
+                self._on_throttled(get_retry_after(error))
+                continue
+            finally:
+                # Whatever func raised (e.g. a read timeout), the slot must come back
+                self._release()
+            self._on_success(getattr(func, '__name__', None), time.monotonic() - start)
+            return result
+        # Last try, let the 429 through, if it happens again
+        self._acquire()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._release()
+
+
+def get_retry_after(error):
+    """
+
+    Get seconds to wait from the Retry-After header of a SpotifyException
+
+    """
+    headers = getattr(error, 'headers', None) or {}
+    retry_after = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return max(1.0, float(retry_after))
+    except (TypeError, ValueError):
+        return 1.0
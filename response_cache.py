@@ -0,0 +1,180 @@
+"""
+
+Persistent cache for responses from Spotify
+
+Subtasks:
+    - Keep responses on disk, compressed, keyed by endpoint and parameters
+    - Expire entries after their TTL
+    - Evict least recently used entries once the cache gets too big
+    - Keep the size as running total and write access times in batches
+    - Count hits and misses
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import json
+import sqlite3
+import threading
+import time
+import zlib
+import config_io as conf
+
+# Access times of hits are written once there are this many
+ACCESS_BATCH = 256
+
+class ResponseCache:
+    """
+
+    SQLite backed response cache, safe to use from worker threads
+
+    Examples
+    --------
+    >>> cache = ResponseCache("cache.db", max_size=200*1024*1024)
+    >>> cache.fetch(None, spot_conn.album_tracks, 'album_tracks', '0LcJLqbBmaGUft1e9Mm8HV')
+    {'items': [...], ...}
+    >>> cache.hit_rate()
+    0.0
+    """
+
+    def __init__(self, path, max_size):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._max_size = max_size
+        self._accessed = {}
+        self.hits = 0
+        self.misses = 0
+        # Readers don't wait on writers, and commits don't wait for the disk every time
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                               "key TEXT PRIMARY KEY, "
+                               "value BLOB NOT NULL, "
+                               "size INTEGER NOT NULL, "
+                               "created REAL NOT NULL, "
+                               "accessed REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed "
+                               "ON responses (accessed)")
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) "
+                                        "FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(endpoint, *args, **kwargs):
+        """
+
+        Build cache key from endpoint and parameters
+
+        """
+        return json.dumps([endpoint, args, sorted(kwargs.items())])
+
+    def get(self, key, ttl=None):
+        """
+
+        Get cached value, `None` if it's not there or older than ttl seconds
+
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            now = time.time()
+            if row is None or (ttl is not None and now - row[1] > ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = now
+            if len(self._accessed) >= ACCESS_BATCH:
+                with self._conn:
+                    self._write_accessed()
+        return json.loads(zlib.decompress(row[0]))
+
+    def _write_accessed(self):
+        """
+
+        Write the access times of the hits so far
+
+        """
+        self._conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                               [(accessed, key) for key, accessed in self._accessed.items()])
+        self._accessed = {}
+
+    def put(self, key, value):
+        """
+
+        Store value and evict old entries, if the cache got too big
+
+        """
+        blob = zlib.compress(json.dumps(value).encode())
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT size FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (key, blob, len(blob), now, now))
+            self._accessed.pop(key, None)
+            self._size += len(blob) - (row[0] if row else 0)
+            if self._size > self._max_size:
+                self._evict()
+
+    def _evict(self):
+        """
+
+        Delete least recently used entries until the cache fits into max_size
+
+        """
+        self._write_accessed()
+        cursor = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed")
+        evict = []
+        for key, entry_size in cursor:
+            if self._size <= self._max_size:
+                break
+            evict.append((key,))
+            self._size -= entry_size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def fetch(self, ttl, func, endpoint, *args, key_args=None, **kwargs):
+        """
+
+        Get cached response of endpoint, or call func(*args, **kwargs) and cache it
+
+        Parameters
+        ----------
+        ttl : seconds until the entry expires, `None` to keep it forever
+        func : function that fetches the response
+        endpoint : str, name of the endpoint for the key
+        key_args : tuple, arguments for the key instead of args, e.g. if the
+                   response also depends on something func doesn't take
+
+        """
+        key = self.make_key(endpoint, *(args if key_args is None else key_args), **kwargs)
+        value = self.get(key, ttl)
+        if value is None:
+            value = func(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def hit_rate(self):
+        """
+
+        Share of lookups that were served from the cache
+
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_cache():
+    """
+
+    Get the response cache of this process, as configured in [Cache]
+
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache(conf.get_key('Cache', 'path', fallback='cache.db'),
+                                   conf.get_cache_size())
+        return _CACHE
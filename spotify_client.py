@@ -0,0 +1,217 @@
+"""
+
+One long-lived Spotify client per process
+
+Subtasks:
+    - Keep-alive connection pool, sized to the number of workers
+    - Retries on server errors (429s are left to the RequestScheduler)
+    - Cache the auth token and refresh it in the background, before it expires
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import spotipy
+from spotipy.cache_handler import CacheHandler
+from spotipy.oauth2 import SpotifyOAuth
+import config_io as conf
+from request_scheduler import RequestScheduler
+
+SCOPE = ("playlist-read-collaborative playlist-read-private playlist-modify-private "
+         "playlist-modify-public user-follow-read")
+REDIRECT_URI = 'http://localhost:8888/callback/'
+# Refresh the token this many seconds before it expires
+REFRESH_MARGIN = 300
+# Wait this many seconds before trying again, if refreshing failed
+REFRESH_RETRY = 30
+
+def make_session(pool_size):
+    """
+
+    Create a requests.Session with a keep-alive pool of pool_size connections
+
+    Server errors and connection problems are retried with backoff, 429s
+    are not, so the RequestScheduler sees them and slows everyone down.
+    Read timeouts aren't retried and neither is POST, the request may have
+    gone through already, and adding tracks twice adds them twice.
+
+    """
+    retry = Retry(total=3, connect=3, read=False, status=3, backoff_factor=0.3,
+                  status_forcelist=(500, 502, 503, 504),
+                  allowed_methods=frozenset(['GET', 'PUT', 'DELETE']),
+                  respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    return session
+
+
+class TokenCache(CacheHandler):
+    """
+
+    Keep the token in memory and in a file, so it survives the process
+
+    spotipy asks for the token before every request, this way it doesn't
+    read the file every time.
+
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._token = None
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as token_file:
+                    self._token = json.load(token_file)
+            except (OSError, ValueError):
+                self._token = None
+
+    def get_cached_token(self):
+        """
+
+        Get token info, `None` if there is none yet
+
+        """
+        with self._lock:
+            return self._token
+
+    def save_token_to_cache(self, token_info):
+        """
+
+        Keep token info, and write it to the file (only readable by the user)
+
+        """
+        with self._lock:
+            self._token = token_info
+            descriptor = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, 'w') as token_file:
+                json.dump(token_info, token_file)
+
+
+class TokenRefresher(threading.Thread):
+    """
+
+    Refresh the token REFRESH_MARGIN seconds before it expires, in the background
+
+    """
+
+    def __init__(self, auth_manager, token_cache):
+        super().__init__(name="token-refresher", daemon=True)
+        self._auth_manager = auth_manager
+        self._token_cache = token_cache
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            token = self._token_cache.get_cached_token()
+            if token is None:
+                return
+            wait = token['expires_at'] - REFRESH_MARGIN - time.time()
+            if wait > 0:
+                self._stopped.wait(wait)
+                continue
+            try:
+                self._auth_manager.refresh_access_token(token['refresh_token'])
+            except Exception: # pylint: disable=broad-except
+                # spotipy refreshes on its own if it's really expired, try again later
+                self._stopped.wait(REFRESH_RETRY)
+
+    def stop(self):
+        """
+
+        Stop refreshing
+
+        """
+        self._stopped.set()
+
+
+class SpotifyClient:
+    """
+
+    Spotify connection with pooled session and a token that stays fresh
+
+    Examples
+    --------
+    >>> client = SpotifyClient('username', client_id, client_secret, workers=8)
+    >>> spot_conn = client.connect(interactive=False)
+    >>> spot_conn.current_user()['id']
+    'username'
+    """
+
+    def __init__(self, username, client_id, client_secret, workers):
+        self.credentials = (username, client_id, client_secret)
+        self._workers = workers
+        # Same file spotipy's prompt_for_user_token uses, so known tokens keep working
+        self._token_cache = TokenCache(conf.get_key('Auth', 'token_cache',
+                                                    fallback='.cache-' + username))
+        self._auth_manager = SpotifyOAuth(client_id=client_id, client_secret=client_secret,
+                                          redirect_uri=REDIRECT_URI, scope=SCOPE,
+                                          cache_handler=self._token_cache)
+        self._refresher = None
+        self._spot_conn = None
+
+    def connect(self, interactive=True):
+        """
+
+        Get the scheduled connection, log in first if needed
+
+        Parameters
+        ----------
+        interactive : bool, ask the user to log in, if there is no valid token
+
+        Returns
+        -------
+        RequestScheduler, or `None` if there is no token
+
+        """
+        if self._spot_conn is not None:
+            return self._spot_conn
+        token = self._auth_manager.validate_token(self._token_cache.get_cached_token())
+        if token is None:
+            if not interactive:
+                return None
+            self._auth_manager.get_access_token(as_dict=False)
+        self._refresher = TokenRefresher(self._auth_manager, self._token_cache)
+        self._refresher.start()
+        self._spot_conn = RequestScheduler(
+            spotipy.Spotify(auth_manager=self._auth_manager,
+                            requests_session=make_session(self._workers)),
+            max_concurrency=self._workers)
+        return self._spot_conn
+
+    def close(self):
+        """
+
+        Stop refreshing the token
+
+        """
+        if self._refresher is not None:
+            self._refresher.stop()
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_client():
+    """
+
+    Get the client of this process, a new one only if the credentials in the config changed
+
+    """
+    global _CLIENT
+    credentials = (conf.get_key('Auth', 'username'), conf.get_key('Auth', 'client_id'),
+                   conf.get_key('Auth', 'client_secret'))
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT.credentials != credentials:
+            if _CLIENT is not None:
+                _CLIENT.close()
+            _CLIENT = SpotifyClient(*credentials, workers=conf.get_workers())
+        return _CLIENT
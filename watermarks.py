@@ -0,0 +1,152 @@
+"""
+
+Per-artist release watermarks
+
+For every artist id, remember the newest album id and release date seen,
+so the next run only has to page through releases newer than that.
+Also remember the cutoff of that scan, older releases were never looked at.
+New watermarks are only kept once a run was successful (see `commit`).
+
+
+Author: Andreas Lindlbauer (@alindl)
+
+"""
+import json
+import os
+import tempfile
+import threading
+import config_io as conf
+
+def sortable_date(album):
+    """
+
+    Get release date of album as string, that sorts the same for every precision
+
+    Examples
+    --------
+    >>> sortable_date({'release_date': '2020', 'release_date_precision': 'year'})
+    '2020-01-01'
+    """
+    release_date = album['release_date']
+    if album['release_date_precision'] == 'year':
+        return release_date + '-01-01'
+    if album['release_date_precision'] == 'month':
+        return release_date + '-01'
+    return release_date
+
+class WatermarkStore:
+    """
+
+    Newest album (id and release date) seen per artist id, kept in a JSON file
+
+    A watermark only covers releases after the cutoff of the run that set it.
+    Runs with an earlier cutoff need to scan everything again (see `covers`).
+
+    Examples
+    --------
+    >>> watermarks = WatermarkStore("watermarks.json")
+    >>> watermarks.get('2dd5mrQZvg6SmahdgVKDzh')
+    {'id': '5VjAwFmZGLvZtvpa1UDlxP', 'release_date': '2019-09-05', 'cutoff': '2019-01-01'}
+    >>> watermarks.covers(watermarks.get('2dd5mrQZvg6SmahdgVKDzh'), '2018-06-01')
+    False
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._watermarks = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as watermark_file:
+                self._watermarks = json.load(watermark_file)
+
+    def get(self, artist_id):
+        """
+
+        Get watermark of artist, `None` if we have never seen them
+
+        """
+        with self._lock:
+            return self._watermarks.get(artist_id)
+
+    @staticmethod
+    def covers(watermark, cutoff):
+        """
+
+        Check if watermark is good for a run with cutoff, i.e. it wasn't set with a later one
+
+        """
+        return watermark.get('cutoff') is not None and cutoff >= watermark['cutoff']
+
+    def is_seen(self, watermark, album):
+        """
+
+        Check if album is at or below the watermark, so everything after it is known
+
+        """
+        return album['id'] == watermark['id'] or \
+               sortable_date(album) < watermark['release_date']
+
+    def update(self, artist_id, albums, cutoff):
+        """
+
+        Remember the newest of albums as new watermark, until `commit` or `discard`
+
+        Parameters
+        ----------
+        albums : List of albums of the artist, scanned for a run with cutoff
+        cutoff : str, YYYY-MM-DD, day of the cutoff of the run
+
+        """
+        if not albums:
+            return
+        newest = max(albums, key=sortable_date)
+        watermark = {'id': newest['id'], 'release_date': sortable_date(newest), 'cutoff': cutoff}
+        with self._lock:
+            old = self._pending.get(artist_id, self._watermarks.get(artist_id))
+            if old is None or watermark['release_date'] >= old['release_date']:
+                self._pending[artist_id] = watermark
+
+    def commit(self):
+        """
+
+        Keep all new watermarks and write them to disk
+
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            self._watermarks.update(self._pending)
+            self._pending = {}
+            directory = os.path.dirname(os.path.abspath(self._path))
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False,
+                                             prefix='.' + os.path.basename(self._path)) \
+                    as watermark_file:
+                json.dump(self._watermarks, watermark_file)
+            os.replace(watermark_file.name, self._path)
+
+    def discard(self):
+        """
+
+        Forget new watermarks, because their songs never made it into a playlist
+
+        """
+        with self._lock:
+            self._pending = {}
+
+
+_WATERMARKS = None
+_WATERMARKS_LOCK = threading.Lock()
+
+def get_watermarks():
+    """
+
+    Get the watermark store of this process, file configured in [Other] watermarks
+
+    """
+    global _WATERMARKS
+    with _WATERMARKS_LOCK:
+        if _WATERMARKS is None:
+            _WATERMARKS = WatermarkStore(conf.get_key('Other', 'watermarks',
+                                                      fallback='watermarks.json'))
+        return _WATERMARKS